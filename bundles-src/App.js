@@ -25,6 +25,7 @@ class App extends Component {
       quickViewProduct: null,  // will be replaced by selected product attributes
       showCart: false,
       checkoutModalActive: false,
+      checkoutAttempt: null,  // {key, body} of the last unconfirmed order, retried with the same Idempotency-Key
     };
     this.handleSearch = this.handleSearch.bind(this);
     this.handleAddToCart = this.handleAddToCart.bind(this);
@@ -62,6 +63,16 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    let body = JSON.stringify(data);
+    let checkoutAttempt = this.state.checkoutAttempt;
+    if (!checkoutAttempt || checkoutAttempt.body !== body){
+      checkoutAttempt = {
+        key: `${Date.now()}-${Math.random().toString(36).slice(2)}`,
+        body,
+      };
+      this.setState({checkoutAttempt});
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,8 +80,9 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': checkoutAttempt.key,
         },
-        body: JSON.stringify(data),
+        body,
       });
 
       if (!response.ok){
@@ -81,6 +93,7 @@ class App extends Component {
 
       this.setState({
         cart: [],
+        checkoutAttempt: null,
       });
 
       alert("Заказ оформлен. Вам перезвонят в течение 10 минут.");
@@ -1,6 +1,7 @@
 import React,{Component} from 'react';
 import {TransitionGroup, CSSTransition} from 'react-transition-group';
 import EmptyCart from './EmptyCart';
+import ProductImage from './ProductImage';
 import { Button } from 'react-bootstrap';
 import {Modal} from 'react-bootstrap';
 import {Table} from 'react-bootstrap';
@@ -26,7 +27,7 @@ class CartModalComponent extends Component{
     let cartItems = this.props.cartItems.map(product => (
       <CSSTransition classNames="fadeIn" key={product.id} timeout={{ enter:500, exit: 300 }}>
         <tr>
-          <td><img src={product.image} style={imgStyle} /></td>
+          <td><ProductImage product={product} variant="thumbnail" style={imgStyle}/></td>
           <td>{product.name}</td>
           <td className="currency">{product.price}</td>
           <td>{product.quantity} шт.</td>
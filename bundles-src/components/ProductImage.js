@@ -0,0 +1,19 @@
+import React from 'react';
+
+// Pre-generated variant of the product image: "thumbnail", "card" or "full"
+const ProductImage = ({product, variant, ...imgProps}) => {
+  const variants = product.image_variants;
+  if (!variants){
+    return <img src={product.image} alt={product.name} {...imgProps}/>;
+  }
+
+  const {jpeg, webp} = variants[variant];
+  return (
+    <picture>
+      {webp && <source srcSet={webp} type="image/webp"/>}
+      <img src={jpeg} alt={product.name} loading="lazy" {...imgProps}/>
+    </picture>
+  )
+};
+
+export default ProductImage;
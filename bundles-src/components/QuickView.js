@@ -3,6 +3,8 @@ import {Modal} from 'react-bootstrap';
 import {Table} from 'react-bootstrap';
 import {Button} from 'react-bootstrap';
 
+import ProductImage from './ProductImage';
+
 class QuickView extends Component{
   render(){
     const imageSizing = {
@@ -17,7 +19,7 @@ class QuickView extends Component{
         </Modal.Header>
         <Modal.Body>
           <center>
-            <img src={this.props.product.image} style={imageSizing}/>
+            <ProductImage product={this.props.product} variant="card" style={imageSizing}/>
             <div className="container-fluid">
               <Table responsive>
                 <thead>
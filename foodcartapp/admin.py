@@ -2,11 +2,11 @@ from django.conf import settings
 from django.contrib import admin
 from django.forms import ModelForm
 from django.shortcuts import HttpResponseRedirect, reverse
-from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
-from .models import (Order, OrderItem, Product, ProductCategory, Restaurant,
+from .images import get_image_url
+from .models import (Banner, Order, OrderItem, Product, ProductCategory, Restaurant,
                      RestaurantMenuItem)
 
 
@@ -29,10 +29,17 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(OrderModelAdmin):
+    readonly_fields = [
+        'total_amount',
+    ]
     inlines = [
         OrderItemInline
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_total_amount()
+
 
 class RestaurantMenuItemInline(admin.TabularInline):
     model = RestaurantMenuItem
@@ -108,14 +115,14 @@ class ProductAdmin(admin.ModelAdmin):
     class Media:
         css = {
             "all": (
-                static("admin/foodcartapp.css")
+                "admin/foodcartapp.css",
             )
         }
 
     def get_image_preview(self, obj):
         if not obj.image:
             return 'выберите картинку'
-        return format_html('<img src="{url}" style="max-height: 200px;"/>', url=obj.image.url)
+        return format_html('<img src="{url}" style="max-height: 200px;"/>', url=get_image_url(obj, 'card'))
 
     get_image_preview.short_description = 'превью'
 
@@ -125,7 +132,7 @@ class ProductAdmin(admin.ModelAdmin):
         edit_url = reverse('admin:foodcartapp_product_change', args=(obj.id,))
         return format_html('<a href="{edit_url}"><img src="{src}" height="50"/></a>',
                            edit_url=edit_url,
-                           src=obj.image.url
+                           src=get_image_url(obj, 'thumbnail')
                            )
 
     get_image_list_preview.short_description = 'превью'
@@ -134,3 +141,30 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(ProductCategory)
 class ProductCategoryAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        'get_image_list_preview',
+        'title',
+        'position',
+        'is_active',
+    ]
+    list_display_links = [
+        'title',
+    ]
+    list_editable = [
+        'position',
+        'is_active',
+    ]
+    list_filter = [
+        'is_active',
+    ]
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return 'нет картинки'
+        return format_html('<img src="{src}" height="50"/>', src=obj.image.url)
+
+    get_image_list_preview.short_description = 'превью'
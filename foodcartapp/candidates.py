@@ -0,0 +1,117 @@
+"""Precomputed restaurants able to cook every order, with distances.
+
+OrderCandidate rows are refreshed only for the orders and restaurants touched
+by a change, so the manager page just reads them.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+
+from places.distances import sort_by_distance
+from places.models import Place
+from places.spatial import SpatialIndex
+
+from .matching import get_menu_index, get_restaurant_index
+from .models import Order, OrderCandidate, OrderItem, Restaurant
+
+REFRESH_CHUNK_SIZE = 1000
+
+
+def refresh_order_candidates(order_ids, restaurant_ids=None):
+    """Recalculate candidates of the orders, limited to the given restaurants if any.
+
+    With ORDER_CANDIDATES_RADIUS_KM set, only restaurants that close to the
+    order are kept, looked up in the spatial index of restaurants. Orders
+    with unknown coordinates keep every restaurant able to cook them.
+    """
+    order_ids = list(order_ids)
+    menu_index = get_menu_index()
+    radius_km = settings.ORDER_CANDIDATES_RADIUS_KM
+    restaurant_index = get_restaurant_index() if radius_km is not None else None
+    restaurants = Restaurant.objects.only('id', 'address').in_bulk(restaurant_ids)
+
+    for chunk_start in range(0, len(order_ids), REFRESH_CHUNK_SIZE):
+        orders = list(
+            Order.objects
+            .filter(id__in=order_ids[chunk_start:chunk_start + REFRESH_CHUNK_SIZE])
+            .only('id', 'address')
+            .prefetch_related(Prefetch('items', queryset=OrderItem.objects.only('order_id', 'product_id')))
+        )
+        addresses = {order.address for order in orders}
+        addresses.update(restaurant.address for restaurant in restaurants.values())
+        coordinates = Place.objects.get_coordinates(addresses)
+
+        groups = []
+        for order in orders:
+            product_ids = {item.product_id for item in order.items.all()}
+            restaurant_ids_in_reach = [
+                restaurant_id for restaurant_id in menu_index.get_restaurant_ids(product_ids)
+                if restaurant_id in restaurants
+            ]
+            if restaurant_index is not None and order.address in coordinates:
+                restaurant_ids_in_reach = [
+                    restaurant_id for restaurant_id, _ in restaurant_index.nearest(
+                        *coordinates[order.address],
+                        radius_km=radius_km,
+                        predicate=set(restaurant_ids_in_reach).__contains__,
+                    )
+                ]
+            groups.append((order.address, [
+                (restaurant_id, restaurants[restaurant_id].address) for restaurant_id in restaurant_ids_in_reach
+            ]))
+        sorted_candidates = sort_by_distance(groups, coordinates)
+
+        with transaction.atomic():
+            stale_candidates = OrderCandidate.objects.filter(order__in=orders)
+            if restaurant_ids is not None:
+                stale_candidates = stale_candidates.filter(restaurant_id__in=restaurant_ids)
+            stale_candidates.delete()
+            OrderCandidate.objects.bulk_create(
+                OrderCandidate(order=order, restaurant_id=restaurant_id, distance_km=distance_km)
+                for order, candidates in zip(orders, sorted_candidates)
+                for restaurant_id, distance_km in candidates
+            )
+
+
+def refresh_menu_item_candidates(restaurant_id, product_id):
+    """A menu item changed: only unprocessed orders with its product may gain or lose its restaurant."""
+    order_ids = (OrderItem.objects
+                 .filter(product_id=product_id, order__status='unprocessed')
+                 .values_list('order_id', flat=True)
+                 .distinct())
+    refresh_order_candidates(order_ids, restaurant_ids=[restaurant_id])
+
+
+def get_unprocessed_order_ids_in_reach(restaurant_id, radius_km):
+    """Unprocessed orders within the radius of the restaurant, found in a spatial index of their addresses."""
+    restaurant_address = Restaurant.objects.filter(pk=restaurant_id).values_list('address', flat=True).first()
+    restaurant_coordinates = Place.objects.get_coordinates([restaurant_address]) if restaurant_address else {}
+    if restaurant_address not in restaurant_coordinates:
+        return []
+
+    order_ids_by_address = defaultdict(list)
+    for order_id, address in Order.objects.filter(status='unprocessed').values_list('id', 'address'):
+        order_ids_by_address[address].append(order_id)
+    coordinates = Place.objects.get_coordinates(order_ids_by_address)
+
+    order_index = SpatialIndex(list(coordinates), list(coordinates.values()))
+    return [
+        order_id
+        for address, _ in order_index.nearest(*restaurant_coordinates[restaurant_address], radius_km=radius_km)
+        for order_id in order_ids_by_address[address]
+    ]
+
+
+def refresh_restaurant_candidates(restaurant_id):
+    """A restaurant moved: only distances of its existing candidates change.
+
+    Unless candidates are limited by radius, then the restaurant may also
+    come in reach of unprocessed orders around its new address.
+    """
+    order_ids = set(OrderCandidate.objects.filter(restaurant_id=restaurant_id).values_list('order_id', flat=True))
+    radius_km = settings.ORDER_CANDIDATES_RADIUS_KM
+    if radius_km is not None:
+        order_ids.update(get_unprocessed_order_ids_in_reach(restaurant_id, radius_km))
+    refresh_order_candidates(order_ids, restaurant_ids=[restaurant_id])
@@ -0,0 +1,81 @@
+from django.http import Http404
+
+from .images import get_image_url, get_image_variant_urls
+from .models import Banner, Product, Restaurant, RestaurantMenuItem
+from .snapshots import get_snapshot, invalidate_snapshots
+
+CATALOGUE_SNAPSHOT_KEY = 'catalogue'
+RESTAURANT_CATALOGUE_SNAPSHOT_KEY = 'restaurant_catalogue:{}'
+BANNERS_SNAPSHOT_KEY = 'banners'
+
+
+def dump_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': get_image_url(product, 'card'),
+        'image_variants': get_image_variant_urls(product),
+    }
+
+
+def dump_products():
+    products = Product.objects.select_related('category').available()
+    return [dump_product(product) for product in products]
+
+
+def dump_restaurant_products(restaurant_id):
+    if not Restaurant.objects.filter(pk=restaurant_id).exists():
+        raise Http404('Ресторан не найден')
+
+    menu_items = (RestaurantMenuItem.objects
+                  .filter(restaurant_id=restaurant_id, availability=True)
+                  .select_related('product__category')
+                  .order_by('product_id'))
+    return [dump_product(menu_item.product) for menu_item in menu_items]
+
+
+def dump_banners():
+    return [
+        {
+            'title': banner.title,
+            'src': banner.image.url,
+            'text': banner.text,
+        }
+        for banner in Banner.objects.active()
+    ]
+
+
+def get_catalogue_snapshot():
+    return get_snapshot(CATALOGUE_SNAPSHOT_KEY, dump_products)
+
+
+def get_restaurant_catalogue_snapshot(restaurant_id):
+    return get_snapshot(
+        RESTAURANT_CATALOGUE_SNAPSHOT_KEY.format(restaurant_id),
+        lambda: dump_restaurant_products(restaurant_id),
+    )
+
+
+def get_banners_snapshot():
+    return get_snapshot(BANNERS_SNAPSHOT_KEY, dump_banners)
+
+
+def invalidate_catalogue():
+    invalidate_snapshots([CATALOGUE_SNAPSHOT_KEY])
+
+
+def invalidate_restaurant_catalogues(restaurant_ids):
+    invalidate_snapshots([
+        RESTAURANT_CATALOGUE_SNAPSHOT_KEY.format(restaurant_id) for restaurant_id in set(restaurant_ids)
+    ])
+
+
+def invalidate_banners():
+    invalidate_snapshots([BANNERS_SNAPSHOT_KEY])
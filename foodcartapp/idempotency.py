@@ -0,0 +1,87 @@
+"""Idempotency-Key support: a retried request gets the response of the first one."""
+import functools
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_MAX_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+INTAKE_TOKEN_NAMESPACE = uuid.UUID('6f1d2c3e-8a4b-4f57-9c1e-2b7d5e0a9f43')
+
+
+def get_request_fingerprint(data):
+    dumped_data = json.dumps(data, sort_keys=True, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return hashlib.sha256(dumped_data.encode()).hexdigest()
+
+
+def get_intake_token(request):
+    """Token of an order accepted into the queue, the same for every retry with one Idempotency-Key.
+
+    The queue is outside the database transaction, so a retry may enqueue
+    an order once more after the first attempt was rolled back. Both
+    entries share the token and the worker saves only one of them.
+    """
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return uuid.uuid4()
+    return uuid.uuid5(INTAKE_TOKEN_NAMESPACE, key)
+
+
+def replay_response(idempotency_key, request_fingerprint):
+    if idempotency_key.request_fingerprint != request_fingerprint:
+        return Response({'detail': 'Ключ идемпотентности уже использован для другого запроса'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(idempotency_key.response_data, status=idempotency_key.response_status,
+                    headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view):
+    """Store successful responses by Idempotency-Key header and replay them on retries.
+
+    The response is stored in the same transaction as the view's writes, so
+    a request either both saves its data and its key or saves neither.
+    With ORDER_INTAKE_ASYNC nothing is stored: the intake token derived from
+    the key already makes retries idempotent, and the request does not
+    write to the main database at all.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({'detail': 'Ключ идемпотентности длиннее {} символов'.format(IDEMPOTENCY_KEY_MAX_LENGTH)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if settings.ORDER_INTAKE_ASYNC:
+            return view(request, *args, **kwargs)
+
+        request_fingerprint = get_request_fingerprint(request.data)
+        stored_key = IdempotencyKey.objects.active().filter(key=key).first()
+        if stored_key:
+            return replay_response(stored_key, request_fingerprint)
+
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.expired().filter(key=key).delete()
+                response = view(request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    IdempotencyKey.objects.create(key=key,
+                                                  request_fingerprint=request_fingerprint,
+                                                  response_status=response.status_code,
+                                                  response_data=response.data,
+                                                  )
+        except IntegrityError:
+            # A concurrent request with the same key has committed first
+            stored_key = IdempotencyKey.objects.filter(key=key).first()
+            if not stored_key:
+                raise
+            return replay_response(stored_key, request_fingerprint)
+        return response
+    return wrapper
@@ -0,0 +1,147 @@
+"""Resized and recompressed variants of product images.
+
+Every variant is saved as JPEG, and as WebP when Pillow is built with it,
+under `variants/<product id>/`, named by a hash of the original image.
+Encoding runs in a pool of processes, so a batch of images uses every CPU
+core and does not hold the GIL of the web process.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger('star_burger.images')
+
+IMAGE_VARIANTS = {
+    'thumbnail': (100, 100),
+    'card': (400, 400),
+    'full': (1200, 1200),
+}
+IMAGE_FORMATS = {
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+if features.check('webp'):
+    IMAGE_FORMATS['webp'] = {'format': 'WEBP', 'quality': 80, 'method': 6}
+VARIANTS_DIR = 'variants'
+
+
+def render_image_variant(source, size, image_format):
+    """Resize image bytes to fit `size` and encode them. Runs in a worker process."""
+    save_options = dict(IMAGE_FORMATS[image_format])
+    with Image.open(io.BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.LANCZOS)
+        if save_options['format'] == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+
+        output = io.BytesIO()
+        image.save(output, save_options.pop('format'), **save_options)
+        return output.getvalue(), image.size
+
+
+def get_variant_name(product_id, source_digest, variant, image_format):
+    """Variants of different products or images never share a name, so they cannot overwrite each other."""
+    return '{}/{}/{}_{}.{}'.format(VARIANTS_DIR, product_id, source_digest, variant, image_format)
+
+
+def get_variant_names(image_variants):
+    return {
+        variant_names[image_format]
+        for variant, variant_names in image_variants.items() if variant in IMAGE_VARIANTS
+        for image_format in IMAGE_FORMATS if image_format in variant_names
+    }
+
+
+def has_image_variants(product):
+    """Whether variants were generated from the current product image."""
+    return bool(product.image_variants) and product.image_variants.get('source') == product.image.name
+
+
+def get_image_variant_urls(product):
+    """URLs and sizes of the product image variants, None if they are not generated yet."""
+    if not has_image_variants(product):
+        return None
+    variants = product.image_variants
+    storage = product.image.storage
+    return {
+        variant: dict(variants[variant], **{
+            image_format: storage.url(variants[variant][image_format])
+            for image_format in IMAGE_FORMATS if image_format in variants[variant]
+        })
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def get_image_url(product, variant):
+    """URL of the JPEG variant, or of the original while variants are missing."""
+    variant_urls = get_image_variant_urls(product)
+    if variant_urls is None:
+        return product.image.url
+    return variant_urls[variant]['jpeg']
+
+
+def generate_image_variants(products, max_workers=None):
+    """Render and save variants of every product image, return products that got them."""
+    sources = {}
+    for product in products:
+        try:
+            with product.image.open('rb') as image_file:
+                sources[product] = image_file.read()
+        except (OSError, ValueError) as error:
+            logger.warning('Cannot read image of product %s: %s', product.id, error)
+
+    if not sources:
+        return []
+
+    jobs_count = len(sources) * len(IMAGE_VARIANTS) * len(IMAGE_FORMATS)
+    max_workers = min(max_workers or settings.IMAGE_VARIANTS_WORKERS or os.cpu_count(), jobs_count)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            (product, variant, image_format): executor.submit(render_image_variant, source, size, image_format)
+            for product, source in sources.items()
+            for variant, size in IMAGE_VARIANTS.items()
+            for image_format in IMAGE_FORMATS
+        }
+
+        updated_products = []
+        for product in sources:
+            storage = product.image.storage
+            source_digest = hashlib.sha256(sources[product]).hexdigest()[:16]
+            variants = {'source': product.image.name}
+            try:
+                for variant in IMAGE_VARIANTS:
+                    for image_format in IMAGE_FORMATS:
+                        content, (width, height) = futures[product, variant, image_format].result()
+                        name = get_variant_name(product.id, source_digest, variant, image_format)
+                        storage.delete(name)
+                        variants.setdefault(variant, {'width': width, 'height': height})
+                        variants[variant][image_format] = storage.save(name, ContentFile(content))
+            except (OSError, ValueError) as error:
+                logger.warning('Cannot render image of product %s: %s', product.id, error)
+                continue
+            product.image_variants = variants
+            updated_products.append(product)
+    return updated_products
+
+
+def save_image_variants(products, max_workers=None):
+    """Generate variants and save them, one UPDATE per product so that catalogue caches are dropped.
+
+    Variants of a replaced image are deleted once the product refers to the new ones.
+    """
+    products = list(products)
+    previous_names = {product: get_variant_names(product.image_variants) for product in products}
+    updated_products = generate_image_variants(products, max_workers=max_workers)
+    for product in updated_products:
+        product.save(update_fields=['image_variants'])
+        for name in previous_names[product] - get_variant_names(product.image_variants):
+            product.image.storage.delete(name)
+    return updated_products
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Удаляет ключи идемпотентности старше IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def handle(self, *args, **options):
+        deleted_count, _ = IdempotencyKey.objects.expired().delete()
+        self.stdout.write(f'Удалено ключей: {deleted_count}')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.images import has_image_variants, save_image_variants
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии картинок товаров, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='пересоздать копии всех картинок')
+        parser.add_argument('--workers', type=int, help='число процессов для обработки картинок')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='сколько картинок обрабатывать за раз')
+
+    def handle(self, *args, **options):
+        products = [
+            product for product in Product.objects.exclude(image='').order_by('id')
+            if options['force'] or not has_image_variants(product)
+        ]
+
+        updated_count = 0
+        batch_size = options['batch_size']
+        for batch_start in range(0, len(products), batch_size):
+            batch = products[batch_start:batch_start + batch_size]
+            updated_count += len(save_image_variants(batch, max_workers=options['workers']))
+        self.stdout.write(f'Картинок обработано: {updated_count} из {len(products)}')
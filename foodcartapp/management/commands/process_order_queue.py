@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.order_queue import get_order_queue
+from foodcartapp.orders import save_queued_orders
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет в базу заказы, принятые в очередь при ORDER_INTAKE_ASYNC'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='сколько заказов сохранять в одной транзакции')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='сколько секунд ждать новых заказов, когда очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='разобрать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        queue = get_order_queue()
+        while True:
+            entries = queue.claim(options['batch_size'])
+            if entries:
+                self.process(queue, entries)
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def process(self, queue, entries):
+        try:
+            orders, rejected_entries = save_queued_orders(entries)
+        except Exception as error:
+            self.stderr.write(f'Не удалось сохранить пачку заказов, сохраняем по одному: {error!r}')
+            self.process_one_by_one(queue, entries)
+            return
+        self.reject(queue, rejected_entries)
+        queue.ack([entry.id for entry in entries])
+        self.stdout.write(f'Сохранено заказов: {len(orders)}')
+
+    def process_one_by_one(self, queue, entries):
+        # Failed entries stay leased and are claimed again when the lease expires
+        for entry in entries:
+            try:
+                _, rejected_entries = save_queued_orders([entry])
+            except Exception as error:
+                self.stderr.write(f'Заказ {entry.token}, попытка {entry.attempts}: {error!r}')
+                if entry.attempts >= settings.ORDER_QUEUE_MAX_ATTEMPTS:
+                    queue.fail(entry.id, repr(error))
+                    self.stderr.write(f'Заказ {entry.token} перенесён в неудавшиеся')
+                continue
+            self.reject(queue, rejected_entries)
+            queue.ack([entry.id])
+
+    def reject(self, queue, entries):
+        for entry in entries:
+            queue.fail(entry.id, 'Все товары заказа удалены')
+            self.stderr.write(f'Заказ {entry.token} перенесён в неудавшиеся: все его товары удалены')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import refresh_order_candidates
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Заново подбирает рестораны для всех заказов'
+
+    def handle(self, *args, **options):
+        order_ids = list(Order.objects.values_list('id', flat=True))
+        refresh_order_candidates(order_ids)
+        self.stdout.write(f'Обновлены рестораны для заказов: {len(order_ids)}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённую стоимость заказов по их содержимому'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='только проверить стоимость заказов, ничего не меняя')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            updated_count = Order.objects.update_total_amount()
+            self.stdout.write(f'Пересчитана стоимость заказов: {updated_count}')
+            return
+
+        wrong_orders = Order.objects.with_wrong_total_amount().order_by('id')
+        for order in wrong_orders:
+            self.stdout.write(f'Заказ {order.id}: сохранено {order.total_amount}, '
+                              f'по содержимому {order.calculated_total_amount}')
+        if wrong_orders:
+            raise CommandError(f'Неверная стоимость у заказов: {len(wrong_orders)}')
+        self.stdout.write('Стоимость всех заказов верна')
@@ -0,0 +1,134 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from places.models import Place
+from places.spatial import SpatialIndex
+
+from .models import Restaurant, RestaurantMenuItem
+
+MENU_INDEX_VERSION_KEY = 'menu_index_version'
+RESTAURANT_INDEX_VERSION_KEY = 'restaurant_index_version'
+
+
+class MenuIndex:
+    """Per-restaurant bitmaps of available products.
+
+    Every product gets a bit, every restaurant a mask of the products it can
+    cook. A restaurant fulfils an order when its mask covers the order mask,
+    which takes a couple of integer operations per restaurant.
+    """
+
+    def __init__(self, availability):
+        self.product_bits = {}
+        self.restaurant_masks = {}
+        for bit, (product_id, restaurant_ids) in enumerate(availability.items()):
+            self.product_bits[product_id] = 1 << bit
+            for restaurant_id in restaurant_ids:
+                self.restaurant_masks[restaurant_id] = self.restaurant_masks.get(restaurant_id, 0) | 1 << bit
+        self.matches = {}
+
+    def get_order_mask(self, product_ids):
+        order_mask = 0
+        for product_id in product_ids:
+            product_bit = self.product_bits.get(product_id)
+            if not product_bit:
+                return None
+            order_mask |= product_bit
+        return order_mask
+
+    def get_restaurant_ids(self, product_ids):
+        order_mask = self.get_order_mask(product_ids)
+        if not order_mask:
+            return []
+
+        restaurant_ids = self.matches.get(order_mask)
+        if restaurant_ids is None:
+            restaurant_ids = [
+                restaurant_id for restaurant_id, restaurant_mask in self.restaurant_masks.items()
+                if restaurant_mask & order_mask == order_mask
+            ]
+            self.matches[order_mask] = restaurant_ids
+        return restaurant_ids
+
+
+class VersionedIndex:
+    """A process-wide index, rebuilt after any process announces a change.
+
+    The version lives in the shared cache, so a change committed in one
+    process makes every other process rebuild its copy on the next request.
+    """
+
+    def __init__(self, version_key, build):
+        self.version_key = version_key
+        self.build = build
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+
+    def get(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(self.version_key, version, None)
+            version = cache.get(self.version_key, version)
+
+        with self.lock:
+            if self.index is None or self.version != version:
+                self.index = self.build()
+                self.version = version
+            return self.index
+
+    def invalidate(self):
+        """Drop the local index now and tell other processes once the change is committed."""
+        with self.lock:
+            self.index = None
+        transaction.on_commit(lambda: cache.set(self.version_key, uuid.uuid4().hex, None))
+
+
+def build_restaurant_index():
+    restaurants = list(Restaurant.objects.only('id', 'address'))
+    coordinates = Place.objects.get_coordinates({restaurant.address for restaurant in restaurants})
+    located_restaurants = [restaurant for restaurant in restaurants if restaurant.address in coordinates]
+    return SpatialIndex(
+        [restaurant.id for restaurant in located_restaurants],
+        [coordinates[restaurant.address] for restaurant in located_restaurants],
+    )
+
+
+_menu_index = VersionedIndex(MENU_INDEX_VERSION_KEY,
+                             lambda: MenuIndex(RestaurantMenuItem.objects.get_availability_matrix()))
+_restaurant_index = VersionedIndex(RESTAURANT_INDEX_VERSION_KEY, build_restaurant_index)
+
+
+def get_menu_index():
+    """Return the process-wide MenuIndex, rebuilding it after menu changes."""
+    return _menu_index.get()
+
+
+def invalidate_menu_index():
+    _menu_index.invalidate()
+
+
+def get_restaurant_index():
+    """Return the process-wide SpatialIndex of restaurant ids with known coordinates."""
+    return _restaurant_index.get()
+
+
+def invalidate_restaurant_index():
+    _restaurant_index.invalidate()
+
+
+def find_nearest_restaurants(product_ids, lat, lon, k=None, radius_km=None):
+    """Up to `k` restaurants able to cook every product within `radius_km`.
+
+    Returns [(restaurant_id, distance_km)], nearest first. Restaurants with
+    unknown coordinates are never found.
+    """
+    able_restaurant_ids = set(get_menu_index().get_restaurant_ids(product_ids))
+    if not able_restaurant_ids:
+        return []
+    return get_restaurant_index().nearest(lat, lon, k=k, radius_km=radius_km,
+                                          predicate=able_restaurant_ids.__contains__)
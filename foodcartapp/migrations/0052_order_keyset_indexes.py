@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-18 20:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0051_auto_20210531_0518'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='registered_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время заказа'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-registered_at', '-id'], name='order_status_registered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-registered_at', '-id'], name='order_registered_idx'),
+        ),
+    ]
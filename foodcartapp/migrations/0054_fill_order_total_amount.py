@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_total_amount(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderItem = apps.get_model('foodcartapp', 'OrderItem')
+
+    items_total_amount = (OrderItem.objects
+                          .filter(order=OuterRef('pk'))
+                          .values('order')
+                          .annotate(total_amount=Sum(F('price') * F('quantity'),
+                                                     output_field=DecimalField(max_digits=10, decimal_places=2)))
+                          .values('total_amount'))
+    Order.objects.update(total_amount=Coalesce(
+        Subquery(items_total_amount),
+        Value(0),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('foodcartapp', '0053_order_total_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_total_amount, migrations.RunPython.noop),
+    ]
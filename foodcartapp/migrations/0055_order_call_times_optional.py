@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_fill_order_total_amount'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='called_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время звонка'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время доставки'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_order_call_times_optional'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurantmenuitem',
+            index=models.Index(condition=models.Q(availability=True), fields=['product'], name='menu_item_available_idx'),
+        ),
+    ]
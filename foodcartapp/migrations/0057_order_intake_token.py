@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_menu_item_available_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='intake_token',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='Токен приёма заказа'),
+        ),
+    ]
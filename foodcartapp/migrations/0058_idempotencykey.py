@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 20:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_order_intake_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ключ')),
+                ('request_fingerprint', models.CharField(max_length=64, verbose_name='Отпечаток запроса')),
+                ('response_status', models.PositiveSmallIntegerField(verbose_name='Код ответа')),
+                ('response_data', models.JSONField(verbose_name='Тело ответа')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-18 20:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(blank=True, null=True, verbose_name='Расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='Заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='Ресторан')),
+            ],
+            options={
+                'verbose_name': 'Ресторан для заказа',
+                'verbose_name_plural': 'Рестораны для заказов',
+                'unique_together': {('order', 'restaurant')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import migrations
+
+BANNERS = [
+    ('Burger', 'Tasty Burger at your door step', 'burger.jpg'),
+    ('Spices', 'All Cuisines', 'food.jpg'),
+    ('New York', 'Food is incomplete without a tasty dessert', 'tasty.jpg'),
+]
+
+
+def add_banners(apps, schema_editor):
+    """Move the banners hardcoded in banners_list_api to the database, images go to media."""
+    Banner = apps.get_model('foodcartapp', 'Banner')
+    storage = Banner._meta.get_field('image').storage
+
+    for position, (title, text, image_name) in enumerate(BANNERS):
+        image_path = os.path.join(settings.BASE_DIR, 'assets', image_name)
+        if not os.path.exists(image_path):
+            continue
+        name = 'banners/{}'.format(image_name)
+        if not storage.exists(name):
+            with open(image_path, 'rb') as image_file:
+                name = storage.save(name, File(image_file))
+        Banner.objects.create(title=title, text=text, image=name, position=position)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('foodcartapp', '0061_banner'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_banners, migrations.RunPython.noop),
+    ]
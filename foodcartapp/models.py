@@ -1,9 +1,13 @@
 import datetime as dt
+from collections import defaultdict
 
+from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models
 from phonenumber_field.modelfields import PhoneNumberField
-from django.db.models import DecimalField, F, Sum
+from django.db.models import DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class Restaurant(models.Model):
@@ -35,10 +39,9 @@ class Restaurant(models.Model):
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = (
-            RestaurantMenuItem.objects.filter(availability=True).values_list('product')
-        )
-        return self.filter(pk__in=products)
+        # Backed by the partial index on available menu items, see RestaurantMenuItem.Meta
+        available_menu_items = RestaurantMenuItem.objects.filter(product=OuterRef('pk'), availability=True)
+        return self.filter(Exists(available_menu_items))
 
 
 class ProductCategory(models.Model):
@@ -79,6 +82,12 @@ class Product(models.Model):
     image = models.ImageField(
         'картинка'
     )
+    image_variants = models.JSONField(
+        'варианты картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     special_status = models.BooleanField(
         'спец.предложение',
         default=False,
@@ -100,6 +109,28 @@ class Product(models.Model):
         return self.name
 
 
+class RestaurantMenuItemQuerySet(models.QuerySet):
+
+    def get_availability_matrix(self):
+        """Return a mapping of product id to ids of restaurants where it is available."""
+        matrix = defaultdict(set)
+        menu_items = self.filter(availability=True).values_list('product_id', 'restaurant_id')
+        for product_id, restaurant_id in menu_items:
+            matrix[product_id].add(restaurant_id)
+
+        return matrix
+
+    def get_availability_bitsets(self, restaurant_ids):
+        """Pack availability into a bitset per product, bit i is set for restaurant_ids[i]."""
+        restaurant_bits = {restaurant_id: 1 << bit for bit, restaurant_id in enumerate(restaurant_ids)}
+        bitsets = defaultdict(int)
+        menu_items = self.filter(availability=True).values_list('product_id', 'restaurant_id')
+        for product_id, restaurant_id in menu_items.iterator():
+            bitsets[product_id] |= restaurant_bits.get(restaurant_id, 0)
+
+        return bitsets
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -119,12 +150,17 @@ class RestaurantMenuItem(models.Model):
         db_index=True
     )
 
+    objects = RestaurantMenuItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'пункт меню ресторана'
         verbose_name_plural = 'пункты меню ресторана'
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            models.Index(fields=['product'], condition=Q(availability=True), name='menu_item_available_idx'),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
@@ -132,14 +168,40 @@ class RestaurantMenuItem(models.Model):
 
 class OrderQuerySet(models.QuerySet):
 
-    def get_total_amount(self):
-        return self.annotate(
-            total_amount=Sum(
-                F('items__price') * F('items__quantity'),
-                output_field=DecimalField(max_digits=8, decimal_places=2)
-            )
+    def registered_before(self, registered_at, order_id):
+        """Orders that go after the given one when sorted by ('-registered_at', '-id')."""
+        return self.filter(
+            Q(registered_at__lt=registered_at) | Q(registered_at=registered_at, id__lt=order_id)
         )
 
+    def with_calculated_total_amount(self):
+        """Annotate orders with the total calculated from their items."""
+        return self.annotate(calculated_total_amount=Coalesce(
+            Subquery(get_items_total_amount()),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ))
+
+    def with_wrong_total_amount(self):
+        return self.with_calculated_total_amount().exclude(total_amount=F('calculated_total_amount'))
+
+    def update_total_amount(self):
+        """Recalculate the stored total of every order in one UPDATE query."""
+        return self.update(total_amount=Coalesce(
+            Subquery(get_items_total_amount()),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ))
+
+
+def get_items_total_amount():
+    return (OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total_amount=Sum(F('price') * F('quantity'),
+                                       output_field=DecimalField(max_digits=10, decimal_places=2)))
+            .values('total_amount'))
+
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -158,19 +220,30 @@ class Order(models.Model):
     phonenumber = PhoneNumberField('Телефон')
     status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='unprocessed')
     comment = models.TextField('Комментарий', blank=True)
-    registered_at = models.DateTimeField('Время заказа', auto_now=True)
-    called_at = models.DateTimeField('Время звонка', )
-    delivered_at = models.DateTimeField('Время доставки', )
+    registered_at = models.DateTimeField('Время заказа', default=timezone.now)
+    called_at = models.DateTimeField('Время звонка', null=True, blank=True)
+    delivered_at = models.DateTimeField('Время доставки', null=True, blank=True)
     payment_method = models.CharField('Способ оплаты', max_length=20, choices=PAYMENT_CHOICES, default='not_selected')
+    total_amount = models.DecimalField('Стоимость заказа', max_digits=10, decimal_places=2, default=0,
+                                       editable=False)
+    intake_token = models.UUIDField('Токен приёма заказа', null=True, blank=True, unique=True, editable=False)
 
     objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return '{} {} {}'.format(self.firstname[:10], self.lastname[:10], self.address[:10])
 
+    def update_total_amount(self):
+        Order.objects.filter(pk=self.pk).update_total_amount()
+        self.refresh_from_db(fields=['total_amount'])
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['status', '-registered_at', '-id'], name='order_status_registered_idx'),
+            models.Index(fields=['-registered_at', '-id'], name='order_registered_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -184,3 +257,67 @@ class OrderItem(models.Model):
         unique_together = [
             ['order', 'product']
         ]
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+
+    def expired(self):
+        return self.filter(created_at__lt=timezone.now() - dt.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS))
+
+    def active(self):
+        return self.filter(created_at__gte=timezone.now() - dt.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS))
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField('Ключ', max_length=255, unique=True)
+    request_fingerprint = models.CharField('Отпечаток запроса', max_length=64)
+    response_status = models.PositiveSmallIntegerField('Код ответа')
+    response_data = models.JSONField('Тело ответа')
+    created_at = models.DateTimeField('Создан', default=timezone.now, db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='candidates', verbose_name='Заказ')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='order_candidates',
+                                   verbose_name='Ресторан')
+    distance_km = models.FloatField('Расстояние, км', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Ресторан для заказа'
+        verbose_name_plural = 'Рестораны для заказов'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+
+
+class BannerQuerySet(models.QuerySet):
+
+    def active(self):
+        return self.filter(is_active=True)
+
+
+class Banner(models.Model):
+    title = models.CharField('Заголовок', max_length=50)
+    text = models.CharField('Текст', max_length=200, blank=True)
+    image = models.ImageField('Картинка', upload_to='banners')
+    position = models.PositiveSmallIntegerField('Порядок', default=0, db_index=True)
+    is_active = models.BooleanField('Показывать', default=True, db_index=True)
+
+    objects = BannerQuerySet.as_manager()
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = 'Баннер'
+        verbose_name_plural = 'Баннеры'
+        ordering = ['position', 'id']
@@ -0,0 +1,130 @@
+"""Durable local queue of accepted but not yet saved orders.
+
+The queue is a separate SQLite file in WAL mode, so appending an order never
+waits for writers of the main database. Every entry is leased by the worker
+that claims it and deleted only after its order is saved. An entry whose
+worker dies is claimed again once the lease expires, so orders are delivered
+at least once; the entry token makes saving them idempotent. Entries that
+cannot be saved are moved to the failed_order table and kept for a person
+to look at.
+"""
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+
+QueuedOrder = namedtuple('QueuedOrder', ['id', 'token', 'payload', 'attempts'])
+
+
+class OrderQueue:
+    def __init__(self, path, lease_seconds=60):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS queued_order (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    token TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    leased_until REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS failed_order (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    token TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    failed_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    error TEXT NOT NULL
+                )
+            ''')
+            self.local.connection = connection
+        return connection
+
+    def put(self, token, payload):
+        """Append an order, unless an entry with the same token is still queued."""
+        self.get_connection().execute(
+            'INSERT OR IGNORE INTO queued_order (token, payload, enqueued_at) VALUES (?, ?, ?)',
+            (str(token), json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+
+    @contextmanager
+    def transaction(self):
+        connection = self.get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def claim(self, limit):
+        """Lease up to `limit` oldest entries that no other worker holds."""
+        now = time.time()
+        with self.transaction() as connection:
+            rows = connection.execute(
+                'SELECT id, token, payload, attempts FROM queued_order '
+                'WHERE leased_until <= ? ORDER BY id LIMIT ?',
+                (now, limit),
+            ).fetchall()
+            connection.executemany(
+                'UPDATE queued_order SET leased_until = ?, attempts = attempts + 1 WHERE id = ?',
+                [(now + self.lease_seconds, row[0]) for row in rows],
+            )
+        return [QueuedOrder(entry_id, token, json.loads(payload), attempts + 1)
+                for entry_id, token, payload, attempts in rows]
+
+    def ack(self, entry_ids):
+        self.get_connection().executemany('DELETE FROM queued_order WHERE id = ?',
+                                          [(entry_id,) for entry_id in entry_ids])
+
+    def fail(self, entry_id, error):
+        """Move an entry to failed_order, so that it is not claimed again."""
+        with self.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO failed_order (token, payload, enqueued_at, failed_at, attempts, error) '
+                'SELECT token, payload, enqueued_at, ?, attempts, ? FROM queued_order WHERE id = ?',
+                (time.time(), error, entry_id),
+            )
+            connection.execute('DELETE FROM queued_order WHERE id = ?', (entry_id,))
+
+    def contains(self, token):
+        row = self.get_connection().execute(
+            'SELECT 1 FROM queued_order WHERE token = ?', (str(token),)
+        ).fetchone()
+        return row is not None
+
+    def has_failed(self, token):
+        row = self.get_connection().execute(
+            'SELECT 1 FROM failed_order WHERE token = ?', (str(token),)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.get_connection().execute('SELECT COUNT(*) FROM queued_order').fetchone()[0]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_order_queue(path, lease_seconds):
+    return OrderQueue(path, lease_seconds)
+
+
+def get_order_queue():
+    return _get_order_queue(settings.ORDER_QUEUE_PATH, settings.ORDER_QUEUE_LEASE_SECONDS)
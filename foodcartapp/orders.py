@@ -0,0 +1,103 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Order, OrderItem, Product
+from .serializers import OrderItemSerializer, OrderSerializer
+
+logger = logging.getLogger('star_burger.orders')
+
+ORDER_FIELDS = ['address', 'firstname', 'lastname', 'phonenumber']
+
+
+def parse_order(data):
+    """Validate an order payload and merge quantities of repeated products.
+
+    Returns the order fields and a dict of product ids to quantities, which
+    is empty for an empty basket.
+    """
+    order_serializer = OrderSerializer(data=data)
+    order_serializer.is_valid(raise_exception=True)
+
+    items_serializer = OrderItemSerializer(data=data.get('products', []), many=True)
+    items_serializer.is_valid(raise_exception=True)
+
+    quantities = defaultdict(int)
+    for item in items_serializer.validated_data:
+        quantities[item['product']] += item['quantity']
+
+    validated_order = order_serializer.validated_data
+    order_fields = {field: validated_order[field] for field in ORDER_FIELDS}
+    return order_fields, dict(quantities)
+
+
+def get_products(product_ids):
+    product_ids = set(product_ids)
+    products = Product.objects.in_bulk(product_ids)
+    unknown_product_ids = product_ids - products.keys()
+    if unknown_product_ids:
+        raise ValidationError({
+            'products': ['Недопустимый первичный ключ "{}" - объект не существует.'.format(product_id)
+                         for product_id in sorted(unknown_product_ids)]
+        })
+    return products
+
+
+def create_order(order_fields, quantities, products, intake_token=None):
+    total_amount = sum(products[product_id].price * quantity for product_id, quantity in quantities.items())
+    order = Order.objects.create(**order_fields, total_amount=total_amount, intake_token=intake_token)
+
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order,
+                  product=products[product_id],
+                  quantity=quantity,
+                  price=products[product_id].price,
+                  )
+        for product_id, quantity in quantities.items()
+    ])
+    return order
+
+
+def dump_queued_order(order_fields, quantities):
+    return {
+        'order': dict(order_fields, phonenumber=str(order_fields['phonenumber'])),
+        'items': list(quantities.items()),
+    }
+
+
+def save_queued_orders(entries):
+    """Save orders of queue entries in one transaction.
+
+    Entries delivered again after a crash are recognized by their token and
+    skipped, so every accepted order is saved exactly once. Returns the saved
+    orders and the rejected entries, whose products were all deleted while
+    they waited in the queue.
+    """
+    with transaction.atomic():
+        saved_tokens = {
+            str(token) for token in
+            Order.objects.filter(intake_token__in=[entry.token for entry in entries])
+                         .values_list('intake_token', flat=True)
+        }
+        products = Product.objects.in_bulk({
+            product_id for entry in entries for product_id, _ in entry.payload['items']
+        })
+
+        orders = []
+        rejected_entries = []
+        for entry in entries:
+            if entry.token in saved_tokens:
+                continue
+            quantities = {}
+            for product_id, quantity in entry.payload['items']:
+                if product_id in products:
+                    quantities[product_id] = quantity
+                else:
+                    logger.warning('Product %s of queued order %s no longer exists', product_id, entry.token)
+            if not quantities:
+                rejected_entries.append(entry)
+                continue
+            orders.append(create_order(entry.payload['order'], quantities, products, intake_token=entry.token))
+    return orders, rejected_entries
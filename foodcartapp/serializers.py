@@ -1,9 +1,12 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import IntegerField, ModelSerializer
 
 from .models import Order, OrderItem
 
 
 class OrderItemSerializer(ModelSerializer):
+    # Products of the whole basket are fetched at once in register_order
+    product = IntegerField(min_value=1)
+
     class Meta:
         model = OrderItem
         exclude = ['order']
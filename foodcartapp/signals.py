@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from places.async_geocoder import schedule_geocoding
+
+from .candidates import (refresh_menu_item_candidates, refresh_order_candidates,
+                         refresh_restaurant_candidates)
+from .catalogue import invalidate_banners, invalidate_catalogue, invalidate_restaurant_catalogues
+from .images import has_image_variants, save_image_variants
+from .matching import invalidate_menu_index, invalidate_restaurant_index
+from .models import Banner, Order, Product, ProductCategory, Restaurant, RestaurantMenuItem
+
+
+@receiver(post_save, sender=Order)
+def update_order_candidates(sender, instance, **kwargs):
+    # Runs after commit, when order items are saved too
+    order_id, address = instance.id, instance.address
+    transaction.on_commit(lambda: schedule_geocoding(address, lambda: refresh_order_candidates([order_id])))
+
+
+@receiver(pre_save, sender=Restaurant)
+def check_restaurant_address(sender, instance, **kwargs):
+    previous_address = Restaurant.objects.filter(pk=instance.pk).values_list('address', flat=True).first()
+    instance.address_changed = previous_address != instance.address
+
+
+@receiver(post_save, sender=Restaurant)
+def update_restaurant_candidates(sender, instance, **kwargs):
+    if not instance.address_changed:
+        return
+    restaurant_id, address = instance.id, instance.address
+
+    def update_restaurant_location():
+        invalidate_restaurant_index()
+        refresh_restaurant_candidates(restaurant_id)
+
+    transaction.on_commit(lambda: schedule_geocoding(address, update_restaurant_location))
+
+
+@receiver(post_delete, sender=Restaurant)
+def update_restaurant_index(sender, **kwargs):
+    invalidate_restaurant_index()
+
+
+@receiver(post_delete, sender=Restaurant)
+def update_deleted_restaurant_catalogue(sender, instance, **kwargs):
+    invalidate_restaurant_catalogues([instance.id])
+
+
+@receiver(post_save, sender=Product)
+def update_image_variants(sender, instance, **kwargs):
+    if not instance.image or has_image_variants(instance):
+        return
+    product_id = instance.id
+    transaction.on_commit(lambda: save_image_variants(Product.objects.filter(pk=product_id)))
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_menu_index(sender, instance, **kwargs):
+    invalidate_menu_index()
+    restaurant_id, product_id = instance.restaurant_id, instance.product_id
+    transaction.on_commit(lambda: refresh_menu_item_candidates(restaurant_id, product_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_catalogue(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_restaurant_catalogue(sender, instance, **kwargs):
+    invalidate_restaurant_catalogues([instance.restaurant_id])
+
+
+@receiver(post_save, sender=Product)
+def update_product_restaurant_catalogues(sender, instance, **kwargs):
+    invalidate_restaurant_catalogues(
+        RestaurantMenuItem.objects.filter(product=instance).values_list('restaurant_id', flat=True)
+    )
+
+
+def get_category_restaurant_ids(category):
+    return list(RestaurantMenuItem.objects.filter(product__category=category).values_list('restaurant_id', flat=True))
+
+
+@receiver(post_save, sender=ProductCategory)
+def update_category_restaurant_catalogues(sender, instance, **kwargs):
+    invalidate_restaurant_catalogues(get_category_restaurant_ids(instance))
+
+
+@receiver(pre_delete, sender=ProductCategory)
+def check_category_restaurants(sender, instance, **kwargs):
+    # Products lose the category by a bulk UPDATE without signals, so collect their restaurants now
+    instance.restaurant_ids = get_category_restaurant_ids(instance)
+
+
+@receiver(post_delete, sender=ProductCategory)
+def update_deleted_category_restaurant_catalogues(sender, instance, **kwargs):
+    invalidate_restaurant_catalogues(instance.restaurant_ids)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def update_banners(sender, **kwargs):
+    invalidate_banners()
@@ -0,0 +1,77 @@
+"""Cached JSON snapshots of API responses.
+
+Every snapshot is stored under a key with its current version, and
+invalidation switches the key to a new version. A snapshot built from data
+that changed meanwhile is stored under the old version and never served,
+however late the build finishes. Snapshots and their versions expire
+after SNAPSHOT_TIMEOUT seconds.
+"""
+import hashlib
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from star_burger.renderers import dumps
+
+Snapshot = namedtuple('Snapshot', ['body', 'etag'])
+
+
+def dump_snapshot(data):
+    body = dumps(data)
+    etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+    return Snapshot(body, etag)
+
+
+def get_version_key(key):
+    return '{}:version'.format(key)
+
+
+def get_snapshot_version(key):
+    """Return the current version of the snapshot and whether this call created it."""
+    version_key = get_version_key(key)
+    version = cache.get(version_key)
+    if version is not None:
+        return version, False
+    version = uuid.uuid4().hex
+    if cache.add(version_key, version, settings.SNAPSHOT_TIMEOUT):
+        return version, True
+    return cache.get(version_key, version), False
+
+
+def get_snapshot(key, build):
+    """Return the cached JSON snapshot, building it with `build()` on a miss."""
+    version, created = get_snapshot_version(key)
+    try:
+        snapshot = cache.get_or_set('{}:{}'.format(key, version), lambda: tuple(dump_snapshot(build())),
+                                    settings.SNAPSHOT_TIMEOUT)
+    except Exception:
+        # Nothing is cached for this key, e.g. the restaurant does not exist, so leave no version behind
+        if created:
+            cache.delete(get_version_key(key))
+        raise
+    return Snapshot(*snapshot)
+
+
+def invalidate_snapshots(keys):
+    """Switch snapshots to new versions now and once more after commit, in case they were rebuilt meanwhile."""
+    if not keys:
+        return
+
+    def change_versions():
+        cache.set_many({get_version_key(key): uuid.uuid4().hex for key in keys}, settings.SNAPSHOT_TIMEOUT)
+
+    change_versions()
+    transaction.on_commit(change_versions)
+
+
+def snapshot_response(request, snapshot):
+    response = get_conditional_response(request, etag=snapshot.etag)
+    if response is None:
+        response = HttpResponse(snapshot.body, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    return response
@@ -0,0 +1,836 @@
+import datetime as dt
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from places.models import Place
+from star_burger import renderers
+from star_burger.cache import TwoTierCache
+from star_burger.test_runner import TEST_CACHES
+
+from .models import (Banner, IdempotencyKey, IdempotencyKeyQuerySet, Order, OrderCandidate, OrderItem,
+                     Product, ProductCategory, Restaurant, RestaurantMenuItem)
+from .catalogue import CATALOGUE_SNAPSHOT_KEY, RESTAURANT_CATALOGUE_SNAPSHOT_KEY
+from .images import IMAGE_FORMATS, save_image_variants
+from .matching import find_nearest_restaurants
+from .order_queue import get_order_queue
+from .orders import save_queued_orders
+from .snapshots import get_snapshot, get_version_key
+
+
+def make_image_content(color, size=(1600, 800)):
+    image_file = io.BytesIO()
+    Image.new('RGBA', size, color).save(image_file, 'PNG')
+    return image_file.getvalue()
+
+
+class RegisterOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.products = [
+            Product.objects.create(name=f'Бургер {number}', category=category, price=100 + number, image='burger.jpg')
+            for number in range(10)
+        ]
+
+    def post_order(self, basket):
+        return self.client.post('/api/order/', {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Красная площадь',
+            'products': basket,
+        }, content_type='application/json')
+
+    def test_order_is_created(self):
+        response = self.post_order([
+            {'product': self.products[0].id, 'quantity': 2},
+            {'product': self.products[1].id, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 100 * 2 + 101)
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity', 'price')),
+            [(self.products[0].id, 2, 100), (self.products[1].id, 1, 101)],
+        )
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        # Products SELECT, Order INSERT and OrderItem INSERT wrapped in a savepoint
+        with self.assertNumQueries(5):
+            response = self.post_order([{'product': self.products[0].id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(5):
+            response = self.post_order([{'product': product.id, 'quantity': 1} for product in self.products])
+        self.assertEqual(response.status_code, 201)
+
+    def test_unknown_product_is_rejected(self):
+        response = self.post_order([{'product': self.products[-1].id + 100, 'quantity': 1}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('products', response.json())
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderTotalAmountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='password')
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=category, price=100, image='burger.jpg')
+        cls.fries = Product.objects.create(name='Картофель фри', category=category, price=50, image='fries.jpg')
+
+    def create_order(self, items):
+        order = Order.objects.create(address='Москва, Красная площадь', firstname='Иван', lastname='Петров',
+                                     phonenumber='+79001234567')
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for product, quantity in items
+        )
+        order.update_total_amount()
+        return order
+
+    def test_admin_recalculates_total_after_inline_edits(self):
+        order = self.create_order([(self.burger, 2)])
+        burger_item = order.items.get()
+        self.client.force_login(self.admin)
+
+        response = self.client.post(reverse('admin:foodcartapp_order_change', args=[order.id]), {
+            'address': order.address,
+            'firstname': order.firstname,
+            'lastname': order.lastname,
+            'phonenumber': str(order.phonenumber),
+            'status': order.status,
+            'comment': '',
+            'registered_at_0': order.registered_at.strftime('%Y-%m-%d'),
+            'registered_at_1': order.registered_at.strftime('%H:%M:%S'),
+            'payment_method': order.payment_method,
+            'items-TOTAL_FORMS': 2,
+            'items-INITIAL_FORMS': 1,
+            'items-0-id': burger_item.id,
+            'items-0-order': order.id,
+            'items-0-product': self.burger.id,
+            'items-0-quantity': 3,
+            'items-0-price': 100,
+            'items-1-order': order.id,
+            'items-1-product': self.fries.id,
+            'items-1-quantity': 1,
+            'items-1-price': 50,
+        })
+
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 100 * 3 + 50)
+
+    def test_verify_reports_wrong_totals(self):
+        order = self.create_order([(self.burger, 2), (self.fries, 1)])
+        self.create_order([(self.fries, 2)])
+        Order.objects.filter(id=order.id).update(total_amount=1)
+        stdout = io.StringIO()
+
+        with self.assertRaisesMessage(CommandError, 'Неверная стоимость у заказов: 1'):
+            call_command('update_order_totals', verify=True, stdout=stdout)
+
+        self.assertRegex(stdout.getvalue(), rf'^Заказ {order.id}: сохранено 1\.00, по содержимому 250(\.00)?\n$')
+
+    def test_update_fixes_wrong_totals(self):
+        order = self.create_order([(self.burger, 2), (self.fries, 1)])
+        Order.objects.filter(id=order.id).update(total_amount=1)
+
+        call_command('update_order_totals', stdout=io.StringIO())
+        call_command('update_order_totals', verify=True, stdout=io.StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 250)
+
+
+class TwoTierCacheTest(TestCase):
+    def create_cache(self, **options):
+        location = uuid.uuid4().hex
+        return TwoTierCache(location, {'OPTIONS': dict({
+            'SHARED': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': location},
+        }, **options)})
+
+    def create_file_based_cache(self, cache_dir):
+        return self.create_cache(SHARED={
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir,
+        })
+
+    def test_file_based_lock_is_held_by_one_process(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        # Two processes sharing one cache directory
+        first_cache = self.create_file_based_cache(cache_dir.name)
+        second_cache = self.create_file_based_cache(cache_dir.name)
+
+        self.assertTrue(first_cache.acquire_lock('catalogue:lock', None))
+        self.assertFalse(second_cache.acquire_lock('catalogue:lock', None))
+        first_cache.release_lock('catalogue:lock', None)
+        self.assertTrue(second_cache.acquire_lock('catalogue:lock', None))
+
+    def test_file_based_lock_of_crashed_process_expires(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        two_tier_cache = self.create_file_based_cache(cache_dir.name)
+        self.assertTrue(two_tier_cache.acquire_lock('catalogue:lock', None))
+        lock_path = two_tier_cache.get_lock_path('catalogue:lock', None)
+        expired_at = time.time() - two_tier_cache.lock_timeout - 1
+        os.utime(lock_path, (expired_at, expired_at))
+
+        self.assertTrue(two_tier_cache.acquire_lock('catalogue:lock', None))
+        self.assertFalse(two_tier_cache.acquire_lock('catalogue:lock', None))
+
+    def test_tests_do_not_use_configured_cache(self):
+        self.assertEqual(settings.CACHES, TEST_CACHES)
+
+    def test_least_recently_used_key_is_evicted_locally(self):
+        two_tier_cache = self.create_cache(LOCAL_MAX_ENTRIES=2)
+        two_tier_cache.set('burger', 1)
+        two_tier_cache.set('fries', 2)
+        two_tier_cache.get('burger')
+
+        two_tier_cache.set('cola', 3)
+
+        self.assertIsNone(two_tier_cache.local.get(two_tier_cache.make_key('fries')))
+        self.assertEqual(two_tier_cache.local.get(two_tier_cache.make_key('burger')), 1)
+        self.assertEqual(two_tier_cache.get('fries'), 2)
+        self.assertEqual(two_tier_cache.local.get_stats()['shared_hits'], 1)
+
+    def test_local_entry_expires_after_local_timeout(self):
+        two_tier_cache = self.create_cache(LOCAL_TIMEOUT=5)
+        two_tier_cache.set('catalogue', 'old')
+        # Another process changes the shared value
+        two_tier_cache.shared.set('catalogue', 'new')
+
+        self.assertEqual(two_tier_cache.get('catalogue'), 'old')
+        with mock.patch('star_burger.cache.time.monotonic', return_value=time.monotonic() + 6):
+            self.assertEqual(two_tier_cache.get('catalogue'), 'new')
+
+    def test_concurrent_misses_compute_value_once(self):
+        two_tier_cache = self.create_cache()
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'catalogue'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(two_tier_cache.get_or_set('catalogue', build)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['catalogue'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_miss_waits_for_value_computed_by_other_process(self):
+        two_tier_cache = self.create_cache()
+        two_tier_cache.shared.add('catalogue:lock', 1)
+        threading.Timer(0.1, two_tier_cache.shared.set, ['catalogue', 'built elsewhere']).start()
+
+        value = two_tier_cache.get_or_set('catalogue', mock.Mock(return_value='built here'))
+
+        self.assertEqual(value, 'built elsewhere')
+        self.assertEqual(two_tier_cache.local.get_stats()['lock_waits'], 1)
+
+    def test_stats(self):
+        two_tier_cache = self.create_cache()
+        two_tier_cache.get('catalogue')
+        two_tier_cache.set('catalogue', 'value')
+        two_tier_cache.get('catalogue')
+        two_tier_cache.local.clear()
+        two_tier_cache.get('catalogue')
+
+        stats = two_tier_cache.local.get_stats()
+        self.assertEqual((stats['misses'], stats['local_hits'], stats['shared_hits'], stats['sets']), (1, 1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 2 / 3)
+
+
+class CompactJSONRenderingTest(TestCase):
+    data = {
+        'price': Decimal('120.50'),
+        'registered_at': dt.datetime(2021, 5, 1, 12, 30, 15, 123456, tzinfo=dt.timezone.utc),
+        'token': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'items': [{'name': 'Чизбургер', 'quantity': 2}],
+        1: None,
+    }
+    expected = ('{"price":"120.50","registered_at":"2021-05-01T12:30:15.123Z",'
+                '"token":"12345678-1234-5678-1234-567812345678",'
+                '"items":[{"name":"Чизбургер","quantity":2}],"1":null}').encode()
+
+    @skipUnless(renderers.orjson, 'orjson is not installed')
+    def test_orjson_output(self):
+        self.assertEqual(renderers.dumps(self.data), self.expected)
+
+    def test_stdlib_output(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.dumps(self.data), self.expected)
+
+    def test_api_responses_are_compact(self):
+        response = self.client.post('/api/order/', {'products': []}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn(b': ', response.content)
+
+
+class IdempotencyKeyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=category, price=100, image='burger.jpg')
+
+    def post_order(self, key, quantity=1, product_id=None):
+        return self.client.post('/api/order/', {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Красная площадь',
+            'products': [{'product': product_id or self.burger.id, 'quantity': quantity}],
+        }, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_original_response(self):
+        response = self.post_order('checkout-1')
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(1):
+            replayed_response = self.post_order('checkout-1')
+
+        self.assertEqual(replayed_response.status_code, 201)
+        self.assertEqual(replayed_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed_response.json(), response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_other_order_is_rejected(self):
+        self.post_order('checkout-1')
+
+        response = self.post_order('checkout-1', quantity=2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_request_does_not_store_key(self):
+        response = self.post_order('checkout-1', product_id=self.burger.id + 100)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post_order('checkout-1')
+        self.assertEqual(response.status_code, 201)
+
+    def test_expired_key_is_reused(self):
+        self.post_order('checkout-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - dt.timedelta(days=2))
+
+        response = self.post_order('checkout-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class ProductListApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product(name='Чизбургер', category=category, price=100)
+        # Saving the product renders variants of its image, which must exist in the test MEDIA_ROOT
+        cls.burger.image.save('burger.png', ContentFile(make_image_content((200, 100, 0, 255), (100, 100))))
+        restaurant = Restaurant.objects.create(name='Тверская', address='Москва, Тверская 1')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.burger)
+
+    def test_repeated_request_is_not_modified(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Чизбургер'])
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+    async def test_catalogue_is_served_over_asgi(self):
+        response = await self.async_client.get('/api/products/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Чизбургер'])
+
+    def test_catalogue_changes_invalidate_snapshot(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.price = 120
+            self.burger.save()
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['price'], '120.00')
+
+    def test_snapshot_built_from_stale_data_is_not_served(self):
+        stale_catalogue = self.client.get('/api/products/').json()
+        cache.clear()
+
+        def build_from_stale_data():
+            # The change is committed while a concurrent request still builds from the old data
+            with self.captureOnCommitCallbacks(execute=True):
+                self.burger.price = 120
+                self.burger.save()
+            return stale_catalogue
+
+        get_snapshot(CATALOGUE_SNAPSHOT_KEY, build_from_stale_data)
+
+        self.assertEqual(self.client.get('/api/products/').json()[0]['price'], '120.00')
+
+
+class BannersListApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        Banner.objects.all().delete()
+        cls.burger = Banner.objects.create(title='Burger', text='Tasty Burger', image='banners/burger.jpg', position=2)
+        Banner.objects.create(title='Spices', text='All Cuisines', image='banners/food.jpg', position=1)
+        Banner.objects.create(title='Hidden', image='banners/tasty.jpg', is_active=False)
+
+    def test_active_banners_are_listed_in_order(self):
+        response = self.client.get('/api/banners/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'title': 'Spices', 'src': '/media/banners/food.jpg', 'text': 'All Cuisines'},
+            {'title': 'Burger', 'src': '/media/banners/burger.jpg', 'text': 'Tasty Burger'},
+        ])
+
+    def test_repeated_request_is_served_from_cache(self):
+        etag = self.client.get('/api/banners/')['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/banners/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_banner_changes_invalidate_snapshot(self):
+        etag = self.client.get('/api/banners/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.is_active = False
+            self.burger.save()
+
+        response = self.client.get('/api/banners/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([banner['title'] for banner in response.json()], ['Spices'])
+
+
+class RestaurantProductListApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=cls.category, price=100, image='burger.jpg')
+        cls.salad = Product.objects.create(name='Салат', category=cls.category, price=80, image='salad.jpg')
+        cls.tverskaya = Restaurant.objects.create(name='Тверская', address='Москва, Тверская 1')
+        cls.arbat = Restaurant.objects.create(name='Арбат', address='Москва, Арбат 1')
+        RestaurantMenuItem.objects.create(restaurant=cls.tverskaya, product=cls.burger)
+        RestaurantMenuItem.objects.create(restaurant=cls.tverskaya, product=cls.salad, availability=False)
+        cls.arbat_salad = RestaurantMenuItem.objects.create(restaurant=cls.arbat, product=cls.salad)
+
+    def get_products(self, restaurant, **headers):
+        return self.client.get(f'/api/restaurants/{restaurant.id}/products/', **headers)
+
+    def test_only_available_restaurant_products_are_listed(self):
+        response = self.get_products(self.tverskaya)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Чизбургер'])
+
+    def test_unknown_restaurant_is_not_found(self):
+        response = self.client.get(f'/api/restaurants/{self.arbat.id + 100}/products/')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(cache.get(get_version_key(RESTAURANT_CATALOGUE_SNAPSHOT_KEY.format(self.arbat.id + 100))))
+
+    def test_deleted_restaurant_is_not_found(self):
+        restaurant = Restaurant.objects.create(name='Пустая', address='Москва, Арбат 2')
+        url = f'/api/restaurants/{restaurant.id}/products/'
+        self.assertEqual(self.client.get(url).json(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.delete()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_menu_change_invalidates_only_its_restaurant(self):
+        tverskaya_etag = self.get_products(self.tverskaya)['ETag']
+        arbat_etag = self.get_products(self.arbat)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.arbat_salad.availability = False
+            self.arbat_salad.save()
+
+        with self.assertNumQueries(0):
+            response = self.get_products(self.tverskaya, HTTP_IF_NONE_MATCH=tverskaya_etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get_products(self.arbat, HTTP_IF_NONE_MATCH=arbat_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_category_deletion_invalidates_restaurants(self):
+        etag = self.get_products(self.tverskaya)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+
+        response = self.get_products(self.tverskaya, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()[0]['category'])
+
+
+class OrderIntakeQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=category, price=100, image='burger.jpg')
+
+    def setUp(self):
+        queue_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(queue_dir.cleanup)
+        settings_override = override_settings(ORDER_INTAKE_ASYNC=True,
+                                              ORDER_QUEUE_PATH=os.path.join(queue_dir.name, 'queue.sqlite3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def post_order(self, **headers):
+        return self.client.post('/api/order/', {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Красная площадь',
+            'products': [{'product': self.burger.id, 'quantity': 2}],
+        }, content_type='application/json', **headers)
+
+    def test_order_is_saved_by_worker(self):
+        response = self.post_order()
+        self.assertEqual(response.status_code, 202)
+        token = response.json()['token']
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.get(f'/api/order/{token}/').json()['status'], 'queued')
+
+        call_command('process_order_queue', once=True, stdout=io.StringIO())
+
+        order = Order.objects.get()
+        self.assertEqual(str(order.intake_token), token)
+        self.assertEqual(order.total_amount, 200)
+        self.assertEqual(list(order.items.values_list('product_id', 'quantity')), [(self.burger.id, 2)])
+        self.assertEqual(len(get_order_queue()), 0)
+        self.assertEqual(self.client.get(f'/api/order/{token}/').json(), {
+            'token': token, 'status': 'created', 'id': order.id,
+        })
+
+    def test_redelivered_order_is_saved_once(self):
+        self.post_order()
+        entries = get_order_queue().claim(10)
+
+        save_queued_orders(entries)
+        save_queued_orders(entries)
+
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_concurrent_retry_is_queued_once(self):
+        response = self.post_order(HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        # The retry misses the stored key, as if both requests had checked it at once
+        with mock.patch.object(IdempotencyKeyQuerySet, 'active', IdempotencyKeyQuerySet.none):
+            retried_response = self.post_order(HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(retried_response.status_code, 202)
+        self.assertEqual(retried_response.json(), response.json())
+        self.assertEqual(len(get_order_queue()), 1)
+        call_command('process_order_queue', once=True, stdout=io.StringIO())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_is_answered_without_database_writes(self):
+        response = self.post_order(HTTP_IDEMPOTENCY_KEY='checkout-1')
+        retried_response = self.post_order(HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(retried_response.status_code, 202)
+        self.assertEqual(retried_response.json(), response.json())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(len(get_order_queue()), 1)
+
+    def test_expired_lease_is_claimed_again(self):
+        self.post_order()
+        queue = get_order_queue()
+        queue.lease_seconds = 0
+        self.addCleanup(setattr, queue, 'lease_seconds', 60)
+
+        first_entry, = queue.claim(10)
+        second_entry, = queue.claim(10)
+
+        self.assertEqual(first_entry.token, second_entry.token)
+        self.assertEqual(second_entry.attempts, 2)
+
+    def test_order_without_remaining_products_is_failed(self):
+        token = self.post_order().json()['token']
+        Product.objects.filter(id=self.burger.id).delete()
+
+        call_command('process_order_queue', once=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(len(get_order_queue()), 0)
+        self.assertEqual(self.client.get(f'/api/order/{token}/').json(), {'token': token, 'status': 'failed'})
+
+    @override_settings(ORDER_QUEUE_MAX_ATTEMPTS=3)
+    def test_order_is_failed_after_max_attempts(self):
+        token = self.post_order().json()['token']
+        queue = get_order_queue()
+        queue.lease_seconds = 0
+        self.addCleanup(setattr, queue, 'lease_seconds', 60)
+
+        with mock.patch('foodcartapp.management.commands.process_order_queue.save_queued_orders',
+                        side_effect=DatabaseError) as save_queued_orders:
+            call_command('process_order_queue', once=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        # Every attempt saves the batch and then the single order
+        self.assertEqual(save_queued_orders.call_count, 6)
+        self.assertEqual(len(queue), 0)
+        self.assertTrue(queue.has_failed(token))
+
+
+class OrderCandidateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=category, price=100, image='burger.jpg')
+        cls.fries = Product.objects.create(name='Картофель фри', category=category, price=50, image='fries.jpg')
+        cls.tverskaya = Restaurant.objects.create(name='Тверская', address='Москва, Тверская 1')
+        cls.arbat = Restaurant.objects.create(name='Арбат', address='Москва, Арбат 2')
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=cls.tverskaya, product=cls.burger),
+            RestaurantMenuItem(restaurant=cls.tverskaya, product=cls.fries),
+            RestaurantMenuItem(restaurant=cls.arbat, product=cls.burger),
+            RestaurantMenuItem(restaurant=cls.arbat, product=cls.fries, availability=False),
+        ])
+        Place.objects.bulk_create([
+            Place(address='москва, красная площадь', lat=55.7539, lon=37.6208),
+            Place(address='москва, тверская 1', lat=55.7649, lon=37.6055),
+            Place(address='москва, арбат 2', lat=55.7494, lon=37.5916),
+            Place(address='москва, пулково', lat=59.8003, lon=30.2625),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def post_order(self, products):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/order/', {
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79001234567',
+                'address': 'Москва, Красная площадь',
+                'products': [{'product': product.id, 'quantity': 1} for product in products],
+            }, content_type='application/json')
+        return Order.objects.latest('id')
+
+    def get_candidates(self, order):
+        return list(order.candidates.order_by('distance_km').values_list('restaurant__name', 'distance_km'))
+
+    def move_restaurant(self, restaurant, address):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.address = address
+            restaurant.save()
+
+    def test_candidates_are_saved_on_order_creation(self):
+        burger_order = self.post_order([self.burger])
+        full_order = self.post_order([self.burger, self.fries])
+
+        burger_candidates = self.get_candidates(burger_order)
+        self.assertEqual([name for name, _ in burger_candidates], ['Тверская', 'Арбат'])
+        self.assertAlmostEqual(burger_candidates[0][1], 1.55, places=2)
+        self.assertEqual([name for name, _ in self.get_candidates(full_order)], ['Тверская'])
+
+    def test_menu_change_refreshes_only_its_restaurant(self):
+        order = self.post_order([self.burger, self.fries])
+        tverskaya_candidate = OrderCandidate.objects.get(order=order)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item = RestaurantMenuItem.objects.get(restaurant=self.arbat, product=self.fries)
+            menu_item.availability = True
+            menu_item.save()
+
+        self.assertEqual([name for name, _ in self.get_candidates(order)], ['Тверская', 'Арбат'])
+        self.assertTrue(OrderCandidate.objects.filter(pk=tverskaya_candidate.pk).exists())
+
+    def test_menu_change_skips_processed_orders(self):
+        order = self.post_order([self.burger, self.fries])
+        Order.objects.filter(pk=order.pk).update(status='processed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item = RestaurantMenuItem.objects.get(restaurant=self.arbat, product=self.fries)
+            menu_item.availability = True
+            menu_item.save()
+
+        self.assertEqual([name for name, _ in self.get_candidates(order)], ['Тверская'])
+
+    def test_restaurant_move_updates_distances(self):
+        order = self.post_order([self.burger])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.arbat.address = 'Москва, Пулково'
+            self.arbat.save()
+
+        candidates = self.get_candidates(order)
+        self.assertEqual([name for name, _ in candidates], ['Тверская', 'Арбат'])
+        self.assertGreater(candidates[1][1], 600)
+
+    @override_settings(ORDER_CANDIDATES_RADIUS_KM=10)
+    def test_radius_limits_candidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.arbat.address = 'Москва, Пулково'
+            self.arbat.save()
+
+        order = self.post_order([self.burger])
+
+        self.assertEqual([name for name, _ in self.get_candidates(order)], ['Тверская'])
+
+    @override_settings(ORDER_CANDIDATES_RADIUS_KM=10)
+    def test_restaurant_move_in_radius_refreshes_unprocessed_orders(self):
+        self.move_restaurant(self.arbat, 'Москва, Пулково')
+        order = self.post_order([self.burger])
+        processed_order = self.post_order([self.burger])
+        Order.objects.filter(pk=processed_order.pk).update(status='processed')
+
+        self.move_restaurant(self.arbat, 'Москва, Арбат 2')
+
+        self.assertEqual([name for name, _ in self.get_candidates(order)], ['Тверская', 'Арбат'])
+        self.assertEqual([name for name, _ in self.get_candidates(processed_order)], ['Тверская'])
+
+        self.move_restaurant(self.arbat, 'Москва, Пулково')
+
+        self.assertEqual([name for name, _ in self.get_candidates(order)], ['Тверская'])
+
+    def test_nearest_restaurants_able_to_cook_order(self):
+        nearest = find_nearest_restaurants({self.burger.id}, 55.7539, 37.6208, k=1)
+        self.assertEqual([restaurant_id for restaurant_id, _ in nearest], [self.tverskaya.id])
+
+        nearest = find_nearest_restaurants({self.burger.id, self.fries.id}, 55.7494, 37.5916)
+        self.assertEqual([restaurant_id for restaurant_id, _ in nearest], [self.tverskaya.id])
+
+
+class ImageVariantsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_product(self, image_name='burger.png', color=(200, 100, 0, 128)):
+        product = Product(name='Чизбургер', price=100)
+        product.image.save(image_name, ContentFile(make_image_content(color)), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        return product
+
+    def test_variants_are_generated_on_upload(self):
+        product = self.create_product()
+
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual((variants['thumbnail']['width'], variants['thumbnail']['height']), (100, 50))
+        self.assertEqual((variants['full']['width'], variants['full']['height']), (1200, 600))
+        for image_format, format_options in IMAGE_FORMATS.items():
+            with product.image.storage.open(variants['card'][image_format]) as variant_file:
+                with Image.open(variant_file) as variant_image:
+                    self.assertEqual((variant_image.format, variant_image.size), (format_options['format'], (400, 200)))
+
+    def test_api_references_variants(self):
+        product = self.create_product()
+        RestaurantMenuItem.objects.create(restaurant=Restaurant.objects.create(name='Тверская'), product=product)
+
+        dumped_product, = self.client.get('/api/products/').json()
+
+        self.assertEqual(dumped_product['image'], '/media/' + product.image_variants['card']['jpeg'])
+        self.assertTrue(dumped_product['image_variants']['thumbnail']['jpeg'].startswith(
+            '/media/variants/{}/'.format(product.id)
+        ))
+
+    def test_regenerated_variants_keep_their_names(self):
+        product = self.create_product()
+        card_name = product.image_variants['card']['jpeg']
+
+        save_image_variants([product])
+
+        self.assertEqual(product.image_variants['card']['jpeg'], card_name)
+        self.assertTrue(product.image.storage.exists(card_name))
+
+    def test_images_with_same_name_do_not_share_variants(self):
+        burger = self.create_product('burger.png', color=(200, 100, 0, 255))
+        other_burger = self.create_product('burger.jpg', color=(0, 100, 200, 255))
+
+        burger_card = burger.image_variants['card']['jpeg']
+        self.assertNotEqual(burger_card, other_burger.image_variants['card']['jpeg'])
+        with burger.image.storage.open(burger_card) as variant_file:
+            with Image.open(variant_file) as variant_image:
+                red, _, blue = variant_image.getpixel((0, 0))
+        self.assertGreater(red, blue)
+
+    def test_variants_of_replaced_image_are_deleted(self):
+        product = self.create_product()
+        old_card = product.image_variants['card']['jpeg']
+
+        product.image.save('burger.png', ContentFile(make_image_content((0, 100, 200, 255))), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+
+        self.assertNotEqual(product.image_variants['card']['jpeg'], old_card)
+        self.assertFalse(product.image.storage.exists(old_card))
+
+
+class CompressedStaticFilesTest(TestCase):
+    def setUp(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        self.static_root = static_root.name
+        settings_override = override_settings(
+            STATIC_ROOT=self.static_root,
+            STATICFILES_STORAGE='whitenoise.storage.CompressedManifestStaticFilesStorage',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as manifest_file:
+            hashed_name = json.load(manifest_file)['paths']['rest_framework/css/bootstrap.min.css']
+        self.assertNotEqual(hashed_name, 'rest_framework/css/bootstrap.min.css')
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, hashed_name + '.gz')))
@@ -1,11 +1,14 @@
 from django.urls import path
 
-from .views import banners_list_api, product_list_api, register_order
+from .views import (banners_list_api, order_intake_status_api, product_list_api,
+                    register_order, restaurant_product_list_api)
 
 app_name = "foodcartapp"
 
 urlpatterns = [
     path('products/', product_list_api),
+    path('restaurants/<int:restaurant_id>/products/', restaurant_product_list_api),
     path('banners/', banners_list_api),
     path('order/', register_order),
+    path('order/<uuid:token>/', order_intake_status_api),
 ]
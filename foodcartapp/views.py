@@ -1,91 +1,60 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
-from django.templatetags.static import static
+from django.http import Http404
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from .models import Order, OrderItem, Product
-from .serializers import OrderItemSerializer, OrderSerializer
+from .catalogue import get_banners_snapshot, get_catalogue_snapshot, get_restaurant_catalogue_snapshot
+from .idempotency import get_intake_token, idempotent
+from .models import Order
+from .order_queue import get_order_queue
+from .orders import create_order, dump_queued_order, get_products, parse_order
+from .snapshots import snapshot_response
 
 
-def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
-        {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
-        }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+async def banners_list_api(request):
+    snapshot = await sync_to_async(get_banners_snapshot)()
+    return snapshot_response(request, snapshot)
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
+async def product_list_api(request):
+    snapshot = await sync_to_async(get_catalogue_snapshot)()
+    return snapshot_response(request, snapshot)
 
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            },
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+
+async def restaurant_product_list_api(request, restaurant_id):
+    snapshot = await sync_to_async(get_restaurant_catalogue_snapshot)(restaurant_id)
+    return snapshot_response(request, snapshot)
 
 
-@transaction.atomic
 @api_view(['POST'])
+@idempotent
+@transaction.atomic
 def register_order(request):
-    order_serializer = OrderSerializer(data=request.data)
-    order_serializer.is_valid(raise_exception=True)
-
-    items_serializer = OrderItemSerializer(data=request.data.get('products', []), many=True)
-    items_serializer.is_valid(raise_exception=True)
-
-    validated_items = items_serializer.validated_data
-    if not validated_items:
+    order_fields, quantities = parse_order(request.data)
+    if not quantities:
         return Response(request.data, status=status.HTTP_204_NO_CONTENT)
 
-    validated_order = order_serializer.validated_data
-    order = Order.objects.create(address=validated_order['address'],
-                                 firstname=validated_order['firstname'],
-                                 lastname=validated_order['lastname'],
-                                 phonenumber=validated_order['phonenumber'],
-                                 )
+    products = get_products(quantities)
 
-    for order_item in validated_items:
-        OrderItem.objects.get_or_create(order=order,
-                                        product=order_item['product'],
-                                        quantity=order_item['quantity'],
-                                        price=order_item['product'].price
-                                        )
+    if settings.ORDER_INTAKE_ASYNC:
+        token = get_intake_token(request)
+        get_order_queue().put(token, dump_queued_order(order_fields, quantities))
+        return Response(dict(request.data, token=str(token)), status=status.HTTP_202_ACCEPTED)
 
+    create_order(order_fields, quantities, products)
     return Response(request.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def order_intake_status_api(request, token):
+    order = Order.objects.filter(intake_token=token).only('id').first()
+    if order:
+        return Response({'token': str(token), 'status': 'created', 'id': order.id})
+    if get_order_queue().contains(token):
+        return Response({'token': str(token), 'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+    if get_order_queue().has_failed(token):
+        return Response({'token': str(token), 'status': 'failed'})
+    raise Http404('Заказ не найден')
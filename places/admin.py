@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from .models import Place
+
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    search_fields = [
+        'address',
+    ]
+    list_display = [
+        'address',
+        'lat',
+        'lon',
+        'status',
+        'fetched_at',
+    ]
+    list_filter = [
+        'status',
+    ]
@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class PlacesConfig(AppConfig):
+    default_auto_field = 'django.db.models.AutoField'
+    name = 'places'
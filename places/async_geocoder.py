@@ -0,0 +1,207 @@
+"""Geocoding on an asyncio event loop through one shared httpx connection pool.
+
+httpx is an optional dependency. It is only needed when GEOCODER_BACKGROUND
+is set: then addresses of saved orders and restaurants are geocoded by a
+background event loop. Otherwise they are geocoded one by one in a worker
+thread with the blocking client. Either way the request that saved them
+does not wait for the geocoder.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+
+from star_burger import instrumentation
+
+from .geocoder import (RETRY_STATUS_CODES, geocode_address, get_addresses_to_geocode,
+                       get_request_params, parse_coordinates, save_places)
+from .models import Place, normalize_address
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger('star_burger.geocoder')
+
+_background_geocoder = None
+_background_geocoder_lock = threading.Lock()
+_geocoding_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geocoder')
+
+
+class AsyncRateLimiter:
+    """Spread calls evenly so that no more than `rate` calls start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_call_at = 0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        call_at = max(now, self.next_call_at)
+        self.next_call_at = call_at + self.interval
+        await asyncio.sleep(call_at - now)
+
+
+class AsyncGeocoder:
+    """Looks addresses up concurrently on one event loop through a keep-alive pool."""
+
+    def __init__(self, apikey=None, base_url=None, max_workers=None, rate_limit=None,
+                 retries=None, backoff=0.5, timeout=10):
+        if httpx is None:
+            raise ImproperlyConfigured('AsyncGeocoder requires httpx: pip install httpx')
+        self.apikey = apikey or settings.YANDEX_GEOCODER_API_KEY
+        self.base_url = base_url or settings.YANDEX_GEOCODER_URL
+        self.max_workers = max_workers or settings.YANDEX_GEOCODER_WORKERS
+        self.retries = settings.YANDEX_GEOCODER_RETRIES if retries is None else retries
+        self.backoff = backoff
+        self.rate_limiter = AsyncRateLimiter(
+            settings.YANDEX_GEOCODER_RATE_LIMIT if rate_limit is None else rate_limit
+        )
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_workers, max_keepalive_connections=self.max_workers),
+            timeout=timeout,
+        )
+
+    async def fetch_coordinates(self, address):
+        instrumentation.count('geocoder_calls')
+        response = await self.client.get(self.base_url, params=get_request_params(self.apikey, address))
+        response.raise_for_status()
+        return parse_coordinates(response.json())
+
+    async def lookup(self, address):
+        """Return (status, lon, lat) for one address, retrying transient failures."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            await self.rate_limiter.wait()
+            try:
+                async with self.semaphore:
+                    coords = await self.fetch_coordinates(address)
+            except httpx.HTTPStatusError as error:
+                if error.response.status_code not in RETRY_STATUS_CODES:
+                    break
+            except httpx.TransportError:
+                continue
+            except (httpx.HTTPError, KeyError, ValueError):
+                break
+            else:
+                if not coords:
+                    return Place.NOT_FOUND, None, None
+                return (Place.FOUND, *coords)
+
+        return Place.FAILED, None, None
+
+    async def geocode(self, addresses):
+        """Look up every distinct address once, keyed by the normalized address."""
+        unique_addresses = {}
+        for address in addresses:
+            unique_addresses.setdefault(normalize_address(address), address)
+        unique_addresses.pop('', None)
+
+        results = await asyncio.gather(*(self.lookup(address) for address in unique_addresses.values()))
+        return dict(zip(unique_addresses, results))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+async def geocode_addresses_async(addresses, force=False, geocoder=None):
+    """Async counterpart of geocode_addresses, database work runs in a worker thread."""
+    normalized_addresses = await sync_to_async(get_addresses_to_geocode)(addresses, force=force)
+    if not normalized_addresses:
+        return {}
+
+    own_geocoder = geocoder is None
+    geocoder = geocoder or AsyncGeocoder()
+    try:
+        results = await geocoder.geocode(normalized_addresses.values())
+    finally:
+        if own_geocoder:
+            await geocoder.aclose()
+    return await sync_to_async(save_places)(results)
+
+
+class BackgroundGeocoder:
+    """An event loop thread geocoding addresses without blocking the caller."""
+
+    def __init__(self):
+        if httpx is None:
+            raise ImproperlyConfigured('GEOCODER_BACKGROUND requires httpx: pip install httpx')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='background-geocoder', daemon=True)
+        self.thread.start()
+        self.geocoder = asyncio.run_coroutine_threadsafe(self.create_geocoder(), self.loop).result()
+
+    @staticmethod
+    async def create_geocoder():
+        return AsyncGeocoder()
+
+    def submit(self, addresses, callback=None):
+        future = asyncio.run_coroutine_threadsafe(self.geocode(addresses, callback), self.loop)
+        future.add_done_callback(self.log_failure)
+        return future
+
+    async def geocode(self, addresses, callback=None):
+        try:
+            return await geocode_addresses_async(addresses, geocoder=self.geocoder)
+        finally:
+            if callback:
+                await sync_to_async(callback)()
+            await sync_to_async(close_old_connections)()
+
+    @staticmethod
+    def log_failure(future):
+        if not future.cancelled() and future.exception():
+            logger.error('Background geocoding failed', exc_info=future.exception())
+
+
+def get_background_geocoder():
+    global _background_geocoder
+    with _background_geocoder_lock:
+        if _background_geocoder is None:
+            _background_geocoder = BackgroundGeocoder()
+        return _background_geocoder
+
+
+def geocode_in_thread(address, callback=None):
+    try:
+        geocode_address(address)
+    finally:
+        try:
+            if callback:
+                callback()
+        finally:
+            close_old_connections()
+
+
+def log_geocoding_failure(future):
+    if future.exception():
+        logger.error('Background geocoding failed', exc_info=future.exception())
+
+
+def schedule_geocoding(address, callback=None):
+    """Geocode the address without blocking the caller.
+
+    GEOCODER_BACKGROUND picks the event loop, otherwise a worker thread
+    geocodes it. An address with known coordinates needs no geocoder call,
+    so its callback runs right away. Otherwise the callback runs once the
+    address is geocoded, successfully or not.
+    """
+    if not get_addresses_to_geocode([address]):
+        if callback:
+            callback()
+        return
+    if settings.GEOCODER_BACKGROUND:
+        get_background_geocoder().submit([address], callback)
+        return
+    _geocoding_executor.submit(geocode_in_thread, address, callback).add_done_callback(log_geocoding_failure)
@@ -0,0 +1,68 @@
+import numpy as np
+from django.conf import settings
+from geopy import distance
+
+EARTH_RADIUS_KM = distance.EARTH_RADIUS
+
+
+def calculate_haversine_distances(origins, destinations):
+    """Great-circle distances in km between rows of two (n, 2) arrays of (lat, lon) degrees."""
+    origins, destinations = np.radians(origins), np.radians(destinations)
+    lat_deltas = destinations[:, 0] - origins[:, 0]
+    lon_deltas = destinations[:, 1] - origins[:, 1]
+
+    a = (np.sin(lat_deltas / 2) ** 2
+         + np.cos(origins[:, 0]) * np.cos(destinations[:, 0]) * np.sin(lon_deltas / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def calculate_geodesic_distances(origins, destinations):
+    """Ellipsoid distances in km, slower but accurate to millimetres."""
+    distances = np.full(len(origins), np.nan)
+    known = ~(np.isnan(origins).any(axis=1) | np.isnan(destinations).any(axis=1))
+    for index in np.flatnonzero(known):
+        distances[index] = distance.geodesic(origins[index], destinations[index]).km
+    return distances
+
+
+def calculate_distances(origins, destinations, geodesic=None):
+    if geodesic is None:
+        geodesic = settings.GEODESIC_DISTANCES
+    if geodesic:
+        return calculate_geodesic_distances(origins, destinations)
+    return calculate_haversine_distances(origins, destinations)
+
+
+def sort_by_distance(groups, coordinates, geodesic=None):
+    """Sort candidates of every group by distance to the group origin in one batch.
+
+    `groups` is a list of (origin_address, [(candidate, address), ...]) and
+    `coordinates` maps addresses to (lat, lon). Returns a list of
+    [(candidate, distance_km), ...] per group, nearest first. Candidates with
+    unknown coordinates go last with distance None.
+    """
+    unknown = (np.nan, np.nan)
+    group_ids, candidates, origins, destinations = [], [], [], []
+    for group_id, (origin_address, group_candidates) in enumerate(groups):
+        origin = coordinates.get(origin_address, unknown)
+        for candidate, address in group_candidates:
+            group_ids.append(group_id)
+            candidates.append(candidate)
+            origins.append(origin)
+            destinations.append(coordinates.get(address, unknown))
+
+    sorted_groups = [[] for _ in groups]
+    if not candidates:
+        return sorted_groups
+
+    distances = calculate_distances(
+        np.array(origins, dtype=float).reshape(-1, 2),
+        np.array(destinations, dtype=float).reshape(-1, 2),
+        geodesic=geodesic,
+    )
+    for index in np.lexsort((distances, group_ids)):
+        distance_ = distances[index]
+        sorted_groups[group_ids[index]].append(
+            (candidates[index], None if np.isnan(distance_) else float(distance_))
+        )
+    return sorted_groups
@@ -0,0 +1,185 @@
+import contextvars
+import datetime as dt
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from star_burger import instrumentation
+
+from .models import Place, normalize_address
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_request_params(apikey, place):
+    return {'geocode': place, 'apikey': apikey, 'format': 'json'}
+
+
+def parse_coordinates(response_data):
+    places_found = response_data['response']['GeoObjectCollection']['featureMember']
+    if not places_found:
+        return None
+    most_relevant = places_found[0]
+    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(' ')
+
+    return float(lon), float(lat)
+
+
+def fetch_coordinates(apikey, place, session=None, base_url=None, timeout=10):
+    base_url = base_url or settings.YANDEX_GEOCODER_URL
+    instrumentation.count('geocoder_calls')
+    response = (session or requests).get(base_url, params=get_request_params(apikey, place), timeout=timeout)
+    response.raise_for_status()
+    return parse_coordinates(response.json())
+
+
+class RateLimiter:
+    """Spread calls evenly so that no more than `rate` calls start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_call_at = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(now, self.next_call_at)
+            self.next_call_at = call_at + self.interval
+        time.sleep(call_at - now)
+
+
+class Geocoder:
+    """Looks addresses up concurrently through one keep-alive connection pool."""
+
+    def __init__(self, apikey=None, base_url=None, max_workers=None, rate_limit=None,
+                 retries=None, backoff=0.5):
+        self.apikey = apikey or settings.YANDEX_GEOCODER_API_KEY
+        self.base_url = base_url or settings.YANDEX_GEOCODER_URL
+        self.max_workers = max_workers or settings.YANDEX_GEOCODER_WORKERS
+        self.retries = settings.YANDEX_GEOCODER_RETRIES if retries is None else retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(
+            settings.YANDEX_GEOCODER_RATE_LIMIT if rate_limit is None else rate_limit
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def lookup(self, address):
+        """Return (status, lon, lat) for one address, retrying transient failures."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.rate_limiter.wait()
+            try:
+                coords = fetch_coordinates(self.apikey, address,
+                                           session=self.session, base_url=self.base_url)
+            except requests.HTTPError as error:
+                if error.response.status_code not in RETRY_STATUS_CODES:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                continue
+            except (requests.RequestException, KeyError, ValueError):
+                break
+            else:
+                if not coords:
+                    return Place.NOT_FOUND, None, None
+                return (Place.FOUND, *coords)
+
+        return Place.FAILED, None, None
+
+    def geocode(self, addresses):
+        """Look up every distinct address once, keyed by the normalized address."""
+        unique_addresses = {}
+        for address in addresses:
+            unique_addresses.setdefault(normalize_address(address), address)
+        unique_addresses.pop('', None)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.lookup, address)
+                for address in unique_addresses.values()
+            ]
+            return {address: future.result() for address, future in zip(unique_addresses, futures)}
+
+    def close(self):
+        self.session.close()
+
+
+def get_addresses_to_geocode(addresses, force=False):
+    """Addresses the geocoder has not answered yet, keyed by the normalized address.
+
+    Found and not found addresses are known for good. Addresses the geocoder
+    failed on are asked again after GEOCODER_FAILED_RETRY_MINUTES.
+    """
+    normalized_addresses = {normalize_address(address): address for address in addresses}
+    normalized_addresses.pop('', None)
+    if not force:
+        failed_recently = Q(status=Place.FAILED, fetched_at__gte=timezone.now() - dt.timedelta(
+            minutes=settings.GEOCODER_FAILED_RETRY_MINUTES
+        ))
+        known_addresses = (Place.objects
+                           .filter(address__in=list(normalized_addresses))
+                           .filter(Q(status__in=[Place.FOUND, Place.NOT_FOUND]) | failed_recently)
+                           .values_list('address', flat=True))
+        for address in known_addresses:
+            del normalized_addresses[address]
+    return normalized_addresses
+
+
+def geocode_addresses(addresses, force=False, geocoder=None):
+    """Geocode addresses missing from the Place table and save them in bulk.
+
+    Returns the saved places keyed by the normalized address.
+    """
+    normalized_addresses = get_addresses_to_geocode(addresses, force=force)
+    if not normalized_addresses:
+        return {}
+
+    own_geocoder = geocoder is None
+    geocoder = geocoder or Geocoder()
+    try:
+        results = geocoder.geocode(normalized_addresses.values())
+    finally:
+        if own_geocoder:
+            geocoder.close()
+    return save_places(results)
+
+
+def save_places(results):
+    """Store geocoder results, keyed by the normalized address, as Place rows."""
+    fetched_at = timezone.now()
+    existing_places = Place.objects.in_bulk(list(results), field_name='address')
+    places = {}
+    for address, (status, lon, lat) in results.items():
+        place = existing_places.get(address) or Place(address=address)
+        place.lat, place.lon, place.status, place.fetched_at = lat, lon, status, fetched_at
+        places[address] = place
+
+    Place.objects.bulk_update(
+        [place for place in places.values() if place.pk],
+        ['lat', 'lon', 'status', 'fetched_at'],
+    )
+    Place.objects.bulk_create(
+        [place for place in places.values() if not place.pk],
+        ignore_conflicts=True,
+    )
+    return places
+
+
+def geocode_address(address, force=False):
+    """Fetch coordinates for the address and store them as a Place."""
+    normalized_address = normalize_address(address)
+    places = geocode_addresses([address], force=force)
+    return places.get(normalized_address) or Place.objects.filter(address=normalized_address).first()
@@ -0,0 +1,30 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order, Restaurant
+from places.geocoder import Geocoder, geocode_addresses
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса всех заказов и ресторанов, которых ещё нет в базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='запросить координаты заново даже для найденных адресов')
+        parser.add_argument('--workers', type=int, help='число параллельных запросов к геокодеру')
+
+    def handle(self, *args, **options):
+        addresses = set(Order.objects.values_list('address', flat=True).distinct())
+        addresses.update(Restaurant.objects.values_list('address', flat=True).distinct())
+
+        geocoder = Geocoder(max_workers=options['workers'])
+        try:
+            places = geocode_addresses(addresses, force=options['force'], geocoder=geocoder)
+        finally:
+            geocoder.close()
+
+        statuses = Counter(place.status for place in places.values())
+        self.stdout.write(f'Адресов всего: {len(addresses)}, запрошено: {len(places)}')
+        for status, count in sorted(statuses.items()):
+            self.stdout.write(f'  {status}: {count}')
@@ -0,0 +1,30 @@
+# Generated by Django 3.2 on 2026-10-18 20:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=100, unique=True, verbose_name='адрес')),
+                ('lat', models.FloatField(blank=True, null=True, verbose_name='широта')),
+                ('lon', models.FloatField(blank=True, null=True, verbose_name='долгота')),
+                ('status', models.CharField(choices=[('found', 'Найден'), ('not_found', 'Не найден'), ('failed', 'Ошибка геокодера')], db_index=True, default='found', max_length=20, verbose_name='статус')),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата запроса к геокодеру')),
+            ],
+            options={
+                'verbose_name': 'место',
+                'verbose_name_plural': 'места',
+            },
+        ),
+    ]
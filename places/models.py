@@ -0,0 +1,50 @@
+from django.db import models
+from django.utils import timezone
+
+
+def normalize_address(address):
+    return ' '.join(address.split()).lower()
+
+
+class PlaceQuerySet(models.QuerySet):
+
+    def get_coordinates(self, addresses):
+        """Return a mapping of address to (lat, lon) for addresses that were geocoded."""
+        normalized_addresses = {address: normalize_address(address) for address in addresses}
+        places = self.filter(
+            address__in=set(normalized_addresses.values()),
+            status=Place.FOUND,
+        )
+        coordinates = {place.address: (place.lat, place.lon) for place in places}
+
+        return {
+            address: coordinates[normalized_address]
+            for address, normalized_address in normalized_addresses.items()
+            if normalized_address in coordinates
+        }
+
+
+class Place(models.Model):
+    FOUND = 'found'
+    NOT_FOUND = 'not_found'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (FOUND, 'Найден'),
+        (NOT_FOUND, 'Не найден'),
+        (FAILED, 'Ошибка геокодера'),
+    )
+
+    address = models.CharField('адрес', max_length=100, unique=True)
+    lat = models.FloatField('широта', null=True, blank=True)
+    lon = models.FloatField('долгота', null=True, blank=True)
+    status = models.CharField('статус', max_length=20, choices=STATUS_CHOICES, default=FOUND, db_index=True)
+    fetched_at = models.DateTimeField('дата запроса к геокодеру', default=timezone.now)
+
+    objects = PlaceQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'место'
+        verbose_name_plural = 'места'
+
+    def __str__(self):
+        return self.address
@@ -0,0 +1,111 @@
+"""k-d tree over points on the Earth's surface for nearest-neighbour queries.
+
+Points are stored as unit vectors in 3D. The straight-line (chord) distance
+between them grows monotonically with the great-circle distance, so an
+ordinary k-d tree over the vectors finds exact nearest points on the sphere.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from .distances import EARTH_RADIUS_KM
+
+LEAF_SIZE = 8
+
+
+def to_unit_vectors(coordinates):
+    """Convert an (n, 2) array of (lat, lon) degrees into an (n, 3) array of unit vectors."""
+    lats, lons = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / (2 * EARTH_RADIUS_KM), math.pi / 2))
+
+
+class _Node:
+    __slots__ = ['axis', 'split', 'left', 'right', 'indices']
+
+    def __init__(self, axis=None, split=None, left=None, right=None, indices=None):
+        self.axis = axis
+        self.split = split
+        self.left = left
+        self.right = right
+        self.indices = indices
+
+
+class SpatialIndex:
+    """Items with (lat, lon) coordinates, searchable by distance from a point.
+
+    Queries visit only the branches that may hold a closer item, which takes
+    logarithmic time for a bounded `k` or `radius_km`.
+    """
+
+    def __init__(self, items, coordinates):
+        self.items = list(items)
+        points = to_unit_vectors(np.array(coordinates, dtype=float).reshape(-1, 2))
+        self.points = points.tolist()
+        self.root = self._build(points, np.arange(len(self.items))) if self.items else None
+
+    def __len__(self):
+        return len(self.items)
+
+    def _build(self, points, indices):
+        if len(indices) <= LEAF_SIZE:
+            return _Node(indices=indices.tolist())
+
+        node_points = points[indices]
+        axis = int(np.argmax(node_points.max(axis=0) - node_points.min(axis=0)))
+        sorted_indices = indices[np.argsort(node_points[:, axis], kind='stable')]
+        middle = len(sorted_indices) // 2
+        return _Node(
+            axis=axis,
+            split=float(points[sorted_indices[middle], axis]),
+            left=self._build(points, sorted_indices[:middle]),
+            right=self._build(points, sorted_indices[middle:]),
+        )
+
+    def nearest(self, lat, lon, k=None, radius_km=None, predicate=None):
+        """Return up to `k` items within `radius_km` as [(item, distance_km)], nearest first.
+
+        Items rejected by `predicate` are skipped without stopping the search.
+        """
+        if self.root is None or k == 0:
+            return []
+        target = to_unit_vectors(np.array([[lat, lon]], dtype=float))[0].tolist()
+        max_chord = km_to_chord(radius_km) if radius_km is not None else math.inf
+        found = []  # max-heap of (-chord, index)
+
+        def get_bound():
+            if k is not None and len(found) == k:
+                return min(max_chord, -found[0][0])
+            return max_chord
+
+        def visit(node):
+            if node.indices is not None:
+                for index in node.indices:
+                    chord = math.dist(self.points[index], target)
+                    if chord > get_bound():
+                        continue
+                    if predicate is not None and not predicate(self.items[index]):
+                        continue
+                    if k is not None and len(found) == k:
+                        heapq.heapreplace(found, (-chord, index))
+                    else:
+                        heapq.heappush(found, (-chord, index))
+                return
+
+            offset = target[node.axis] - node.split
+            near, far = (node.left, node.right) if offset < 0 else (node.right, node.left)
+            visit(near)
+            if abs(offset) <= get_bound():
+                visit(far)
+
+        visit(self.root)
+        return [(self.items[index], chord_to_km(-negative_chord))
+                for negative_chord, index in sorted(found, reverse=True)]
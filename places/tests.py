@@ -0,0 +1,304 @@
+import datetime as dt
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import sync_to_async
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from geopy import distance
+
+from foodcartapp.models import Restaurant
+
+from .async_geocoder import AsyncGeocoder, geocode_addresses_async, httpx, schedule_geocoding
+from .distances import calculate_haversine_distances, sort_by_distance
+from .geocoder import Geocoder, geocode_addresses
+from .models import Place
+from .spatial import SpatialIndex
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        address = parse_qs(urlparse(self.path).query)['geocode'][0]
+        server = self.server
+        with server.lock:
+            server.requests[address] += 1
+            failures_left = server.failures.get(address, 0)
+            if failures_left:
+                server.failures[address] -= 1
+
+        if failures_left:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        members = []
+        if address in server.coordinates:
+            lon, lat = server.coordinates[address]
+            members.append({'GeoObject': {'Point': {'pos': f'{lon} {lat}'}}})
+        body = json.dumps({'response': {'GeoObjectCollection': {'featureMember': members}}}).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGeocoderTestCase(TestCase):
+    coordinates = {
+        'Москва, Тверская 1': (37.61, 55.76),
+        'Москва, Арбат 2': (37.59, 55.75),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGeocoderHandler)
+        cls.server.lock = threading.Lock()
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.url = 'http://127.0.0.1:{}/1.x'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.coordinates = dict(self.coordinates)
+        self.server.requests = Counter()
+        self.server.failures = {}
+
+    def get_geocoder(self, **kwargs):
+        return Geocoder(apikey='test', base_url=self.url, rate_limit=0, backoff=0, **kwargs)
+
+
+class GeocoderTest(StubGeocoderTestCase):
+    def test_duplicate_addresses_are_requested_once(self):
+        results = self.get_geocoder().geocode([
+            'Москва, Тверская 1',
+            '  москва,  тверская 1 ',
+            'Москва, Арбат 2',
+        ])
+
+        self.assertEqual(results, {
+            'москва, тверская 1': (Place.FOUND, 37.61, 55.76),
+            'москва, арбат 2': (Place.FOUND, 37.59, 55.75),
+        })
+        self.assertEqual(sum(self.server.requests.values()), 2)
+
+    def test_transient_errors_are_retried(self):
+        self.server.failures['Москва, Арбат 2'] = 2
+
+        status, lon, lat = self.get_geocoder(retries=2).lookup('Москва, Арбат 2')
+
+        self.assertEqual(status, Place.FOUND)
+        self.assertEqual(self.server.requests['Москва, Арбат 2'], 3)
+
+    def test_gives_up_after_retries(self):
+        self.server.failures['Москва, Арбат 2'] = 5
+
+        result = self.get_geocoder(retries=1).lookup('Москва, Арбат 2')
+
+        self.assertEqual(result, (Place.FAILED, None, None))
+        self.assertEqual(self.server.requests['Москва, Арбат 2'], 2)
+
+    def test_unknown_address(self):
+        result = self.get_geocoder().lookup('Нигде')
+
+        self.assertEqual(result, (Place.NOT_FOUND, None, None))
+
+
+class GeocodeAddressesTest(StubGeocoderTestCase):
+    def test_saves_places_in_bulk(self):
+        Place.objects.create(address='москва, арбат 2', status=Place.FAILED,
+                             fetched_at=timezone.now() - dt.timedelta(hours=2))
+
+        with self.assertNumQueries(4):
+            geocode_addresses(['Москва, Тверская 1', 'Москва, Арбат 2', 'Нигде'],
+                              geocoder=self.get_geocoder())
+
+        places = {place.address: place for place in Place.objects.all()}
+        self.assertEqual(places['москва, тверская 1'].status, Place.FOUND)
+        self.assertEqual(places['москва, арбат 2'].status, Place.FOUND)
+        self.assertEqual((places['москва, арбат 2'].lat, places['москва, арбат 2'].lon), (55.75, 37.59))
+        self.assertEqual(places['нигде'].status, Place.NOT_FOUND)
+
+    def test_found_addresses_are_not_requested_again(self):
+        Place.objects.create(address='москва, арбат 2', lat=55.75, lon=37.59)
+
+        geocode_addresses(['Москва, Арбат 2'], geocoder=self.get_geocoder())
+
+        self.assertFalse(self.server.requests)
+
+    def test_not_found_and_recently_failed_addresses_are_not_requested_again(self):
+        Place.objects.create(address='нигде', status=Place.NOT_FOUND)
+        Place.objects.create(address='москва, арбат 2', status=Place.FAILED)
+
+        geocode_addresses(['Нигде', 'Москва, Арбат 2'], geocoder=self.get_geocoder())
+        self.assertFalse(self.server.requests)
+
+        geocode_addresses(['Нигде', 'Москва, Арбат 2'], force=True, geocoder=self.get_geocoder())
+        self.assertEqual(set(self.server.requests), {'Нигде', 'Москва, Арбат 2'})
+
+    def test_management_command_warms_all_addresses(self):
+        Restaurant.objects.create(name='Star Burger Тверская', address='Москва, Тверская 1')
+
+        with override_settings(YANDEX_GEOCODER_URL=self.url, YANDEX_GEOCODER_RATE_LIMIT=0):
+            call_command('geocode_addresses', stdout=StringIO())
+
+        self.assertEqual(Place.objects.get().address, 'москва, тверская 1')
+
+
+@skipUnless(httpx, 'httpx is not installed')
+class AsyncGeocoderTest(StubGeocoderTestCase):
+    def get_async_geocoder(self, **kwargs):
+        return AsyncGeocoder(apikey='test', base_url=self.url, rate_limit=0, backoff=0, **kwargs)
+
+    async def test_duplicate_addresses_are_requested_once(self):
+        geocoder = self.get_async_geocoder()
+        try:
+            results = await geocoder.geocode(['Москва, Тверская 1', 'москва, тверская 1', 'Нигде'])
+        finally:
+            await geocoder.aclose()
+
+        self.assertEqual(results, {
+            'москва, тверская 1': (Place.FOUND, 37.61, 55.76),
+            'нигде': (Place.NOT_FOUND, None, None),
+        })
+        self.assertEqual(sum(self.server.requests.values()), 2)
+
+    async def test_transient_errors_are_retried(self):
+        self.server.failures['Москва, Арбат 2'] = 2
+
+        geocoder = self.get_async_geocoder(retries=2)
+        try:
+            status, lon, lat = await geocoder.lookup('Москва, Арбат 2')
+        finally:
+            await geocoder.aclose()
+
+        self.assertEqual(status, Place.FOUND)
+        self.assertEqual(self.server.requests['Москва, Арбат 2'], 3)
+
+    async def test_places_are_saved(self):
+        geocoder = self.get_async_geocoder()
+        try:
+            await geocode_addresses_async(['Москва, Тверская 1'], geocoder=geocoder)
+        finally:
+            await geocoder.aclose()
+
+        place = await sync_to_async(Place.objects.get)()
+        self.assertEqual((place.address, place.status), ('москва, тверская 1', Place.FOUND))
+
+
+@override_settings(GEOCODER_BACKGROUND=False)
+class ScheduleGeocodingTest(TestCase):
+    def test_new_address_is_geocoded_in_worker_thread(self):
+        geocoded = threading.Event()
+        geocoding_threads = []
+        callback = mock.Mock(side_effect=geocoded.set)
+
+        def geocode_address(address):
+            geocoding_threads.append(threading.current_thread())
+
+        with mock.patch('places.async_geocoder.geocode_address', side_effect=geocode_address):
+            schedule_geocoding('Москва, Тверская 1', callback)
+            self.assertTrue(geocoded.wait(5))
+
+        self.assertEqual(len(geocoding_threads), 1)
+        self.assertIsNot(geocoding_threads[0], threading.current_thread())
+        callback.assert_called_once_with()
+
+    def test_known_address_runs_callback_right_away(self):
+        Place.objects.create(address='москва, тверская 1', lat=55.76, lon=37.61)
+        callback = mock.Mock()
+
+        with mock.patch('places.async_geocoder.geocode_address') as geocode_address:
+            schedule_geocoding('Москва, Тверская 1', callback)
+
+        geocode_address.assert_not_called()
+        callback.assert_called_once_with()
+
+
+class SortByDistanceTest(SimpleTestCase):
+    coordinates = {
+        'Красная площадь': (55.7539, 37.6208),
+        'Тверская': (55.7649, 37.6055),
+        'Арбат': (55.7494, 37.5916),
+        'Пулково': (59.8003, 30.2625),
+    }
+
+    def test_candidates_are_sorted_by_distance(self):
+        groups = [
+            ('Красная площадь', [('Пулково', 'Пулково'), ('Арбат', 'Арбат'), ('Тверская', 'Тверская')]),
+            ('Пулково', [('Тверская', 'Тверская')]),
+        ]
+
+        sorted_groups = sort_by_distance(groups, self.coordinates, geodesic=False)
+
+        self.assertEqual([name for name, _ in sorted_groups[0]], ['Тверская', 'Арбат', 'Пулково'])
+        self.assertEqual([name for name, _ in sorted_groups[1]], ['Тверская'])
+
+    def test_haversine_is_close_to_geodesic(self):
+        groups = [('Красная площадь', [('Пулково', 'Пулково')])]
+
+        [[(_, haversine_km)]] = sort_by_distance(groups, self.coordinates, geodesic=False)
+        [[(_, geodesic_km)]] = sort_by_distance(groups, self.coordinates, geodesic=True)
+
+        expected_km = distance.geodesic(self.coordinates['Красная площадь'], self.coordinates['Пулково']).km
+        self.assertAlmostEqual(geodesic_km, expected_km, places=6)
+        self.assertAlmostEqual(haversine_km, expected_km, delta=expected_km * 0.005)
+
+    def test_unknown_coordinates_go_last(self):
+        groups = [('Красная площадь', [('Нигде', 'Нигде'), ('Арбат', 'Арбат')]), ('Нигде', [('Арбат', 'Арбат')])]
+
+        sorted_groups = sort_by_distance(groups, self.coordinates)
+
+        self.assertEqual(sorted_groups[0][0][0], 'Арбат')
+        self.assertEqual(sorted_groups[0][1], ('Нигде', None))
+        self.assertEqual(sorted_groups[1], [('Арбат', None)])
+
+
+class SpatialIndexTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.coordinates = np.column_stack([rng.uniform(50, 60, 500), rng.uniform(30, 40, 500)])
+        self.index = SpatialIndex(range(len(self.coordinates)), self.coordinates)
+
+    def get_nearest_by_brute_force(self, lat, lon, k, radius_km, predicate):
+        distances = calculate_haversine_distances(np.tile((lat, lon), (len(self.coordinates), 1)), self.coordinates)
+        return [
+            (item, distances[item]) for item in np.argsort(distances)
+            if distances[item] <= radius_km and predicate(item)
+        ][:k]
+
+    def test_matches_brute_force(self):
+        for lat, lon in [(55, 35), (50.1, 39.9), (61, 29)]:
+            with self.subTest(lat=lat, lon=lon):
+                nearest = self.index.nearest(lat, lon, k=5, radius_km=150, predicate=lambda item: item % 3 == 0)
+                expected = self.get_nearest_by_brute_force(lat, lon, 5, 150, lambda item: item % 3 == 0)
+
+                self.assertEqual([item for item, _ in nearest], [item for item, _ in expected])
+                for (_, distance_km), (_, expected_km) in zip(nearest, expected):
+                    self.assertAlmostEqual(distance_km, expected_km, places=6)
+
+    def test_radius_limits_results(self):
+        nearest = self.index.nearest(55, 35, radius_km=20)
+
+        expected = self.get_nearest_by_brute_force(55, 35, None, 20, lambda item: True)
+        self.assertEqual([item for item, _ in nearest], [item for item, _ in expected])
+        self.assertTrue(all(distance_km <= 20 for _, distance_km in nearest))
+
+    def test_empty_index(self):
+        self.assertEqual(SpatialIndex([], []).nearest(55, 35, k=3), [])
@@ -0,0 +1,252 @@
+"""Query-count, latency and memory benchmarks of the hot endpoints.
+
+The database is seeded with a synthetic catalogue and order history of the
+given size, then every endpoint is requested through the Django test client.
+See the `benchmark` management command for running the suite.
+"""
+import datetime as dt
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from foodcartapp.candidates import refresh_order_candidates
+from foodcartapp.catalogue import dump_products
+from foodcartapp.models import (Order, OrderItem, Product, ProductCategory,
+                                Restaurant, RestaurantMenuItem)
+from places.models import Place, normalize_address
+from star_burger import renderers
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_budgets.json')
+
+SCALES = {
+    10: {'orders': 10, 'products': 10, 'restaurants': 10},
+    1000: {'orders': 1000, 'products': 1000, 'restaurants': 100},
+    100000: {'orders': 100000, 'products': 5000, 'restaurants': 300},
+}
+MENU_ITEMS_PER_PRODUCT = 5
+ITEMS_PER_ORDER = 3
+BATCH_SIZE = 5000
+# Benchmarks seed fake data, which must never reach the shared cache or the replicas
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'star_burger.cache.TwoTierCache',
+        'LOCATION': 'benchmark',
+        'OPTIONS': {
+            'SHARED': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'benchmark',
+            },
+        },
+    },
+}
+
+
+def isolate_benchmarks():
+    """Settings override giving the benchmarks their own cache and no read replicas."""
+    return override_settings(CACHES=BENCHMARK_CACHES, DATABASE_REPLICAS=[])
+
+
+def seed_database(size, seed=0):
+    """Fill an empty database with a catalogue and order history of the given scale."""
+    scale = SCALES[size]
+    rng = random.Random(seed)
+
+    ProductCategory.objects.bulk_create(
+        ProductCategory(name=f'Категория {number}') for number in range(10)
+    )
+    categories = list(ProductCategory.objects.all())
+    Product.objects.bulk_create((
+        Product(name=f'Товар {number}', category=rng.choice(categories),
+                price=Decimal(rng.randint(50, 500)), image='burger.jpg')
+        for number in range(scale['products'])
+    ), batch_size=BATCH_SIZE)
+    Restaurant.objects.bulk_create((
+        Restaurant(name=f'Ресторан {number}', address=f'Москва, ресторан {number}')
+        for number in range(scale['restaurants'])
+    ), batch_size=BATCH_SIZE)
+    products = list(Product.objects.all())
+    restaurant_ids = list(Restaurant.objects.values_list('id', flat=True))
+
+    RestaurantMenuItem.objects.bulk_create((
+        RestaurantMenuItem(product=product, restaurant_id=restaurant_id, availability=rng.random() < 0.9)
+        for product in products
+        for restaurant_id in rng.sample(restaurant_ids, min(MENU_ITEMS_PER_PRODUCT, len(restaurant_ids)))
+    ), batch_size=BATCH_SIZE)
+
+    now = timezone.now()
+    Order.objects.bulk_create((
+        Order(address=f'Москва, улица {number % 1000}, дом {number}', firstname='Иван', lastname='Петров',
+              phonenumber='+79001234567', registered_at=now - dt.timedelta(minutes=number),
+              status=rng.choice(['unprocessed', 'processed']))
+        for number in range(scale['orders'])
+    ), batch_size=BATCH_SIZE)
+    order_items = (
+        OrderItem(order_id=order_id, product=product, quantity=rng.randint(1, 3), price=product.price)
+        for order_id in Order.objects.values_list('id', flat=True).iterator()
+        for product in rng.sample(products, min(ITEMS_PER_ORDER, len(products)))
+    )
+    OrderItem.objects.bulk_create(order_items, batch_size=BATCH_SIZE)
+    Order.objects.update_total_amount()
+
+    addresses = set(Order.objects.values_list('address', flat=True).distinct())
+    addresses.update(Restaurant.objects.values_list('address', flat=True))
+    Place.objects.bulk_create((
+        Place(address=normalize_address(address), lat=55.5 + rng.random() / 2, lon=37.3 + rng.random() / 2)
+        for address in addresses
+    ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+    refresh_order_candidates(Order.objects.values_list('id', flat=True))
+
+
+def get_endpoints(rng):
+    product_ids = list(Product.objects.available().values_list('id', flat=True)[:100])
+
+    def get_order_payload():
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Красная площадь',
+            'products': [{'product': product_id, 'quantity': 1}
+                         for product_id in rng.sample(product_ids, min(ITEMS_PER_ORDER, len(product_ids)))],
+        }
+
+    return {
+        'product_list_api': lambda client: client.get('/api/products/'),
+        'register_order': lambda client: client.post('/api/order/', get_order_payload(),
+                                                     content_type='application/json'),
+        'view_products': lambda client: client.get('/manager/products/'),
+        'view_orders': lambda client: client.get('/manager/orders/'),
+    }
+
+
+def consume(response):
+    """Read a streaming response to the end, as a browser would."""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(client, request, repeat):
+    """Run the request once to warm caches, then measure queries, time and memory."""
+    response = consume(request(client))
+    if response.status_code >= 400:
+        raise RuntimeError('Unexpected response status {}'.format(response.status_code))
+
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        consume(request(client))
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            consume(request(client))
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'queries': len(queries),
+        'time_ms': round(statistics.median(timings), 2),
+        'max_time_ms': round(max(timings), 2),
+        'peak_memory_kb': round(peak_memory / 1024, 1),
+    }
+
+
+# The geocoder is an external service, so orders are "geocoded" against a closed local port
+@override_settings(YANDEX_GEOCODER_URL='http://127.0.0.1:9/1.x', YANDEX_GEOCODER_RETRIES=0)
+@isolate_benchmarks()
+def run_benchmarks(repeat=5, seed=0):
+    """Measure every endpoint against the data already in the database."""
+    cache.clear()
+    manager, _ = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+    client = Client()
+    client.force_login(manager)
+
+    endpoints = get_endpoints(random.Random(seed))
+    return {name: measure(client, request, repeat) for name, request in endpoints.items()}
+
+
+def compare_catalogue_queries(repeat=5):
+    """Query plans and timings of the catalogue query before and after the switch to EXISTS."""
+    available_product_ids = RestaurantMenuItem.objects.filter(availability=True).values_list('product')
+    querysets = {
+        'in_subquery': Product.objects.select_related('category').filter(pk__in=available_product_ids),
+        'exists': Product.objects.select_related('category').available(),
+    }
+
+    comparison = {}
+    for name, queryset in querysets.items():
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started_at) * 1000)
+        comparison[name] = {
+            'plan': queryset.explain().splitlines(),
+            'time_ms': round(statistics.median(timings), 2),
+        }
+    return comparison
+
+
+def dump_without_orjson(data):
+    with mock.patch.object(renderers, 'orjson', None):
+        return renderers.dumps(data)
+
+
+def compare_catalogue_encoders(repeat=5):
+    """Time and size of the encoded catalogue: indented stdlib JSON, compact stdlib JSON and orjson."""
+    data = dump_products()
+    encoders = {
+        'stdlib_indented': lambda: json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, indent=4).encode(),
+        'stdlib_compact': lambda: dump_without_orjson(data),
+    }
+    if renderers.orjson is not None:
+        encoders['orjson'] = lambda: renderers.dumps(data)
+
+    comparison = {}
+    for name, encode in encoders.items():
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            body = encode()
+            timings.append((time.perf_counter() - started_at) * 1000)
+        comparison[name] = {
+            'time_ms': round(statistics.median(timings), 2),
+            'size_kb': round(len(body) / 1024, 1),
+        }
+    return comparison
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as budgets_file:
+        return json.load(budgets_file)
+
+
+def check_budgets(report, budgets):
+    """Return descriptions of every metric exceeding its budget."""
+    violations = []
+    for size, endpoints in report.items():
+        for endpoint, metrics in endpoints.items():
+            if 'queries' not in metrics:
+                continue
+            endpoint_budget = budgets.get(str(size), {}).get(endpoint, {})
+            for metric, limit in endpoint_budget.items():
+                if metrics[metric] > limit:
+                    violations.append(f'{size}/{endpoint}: {metric} {metrics[metric]} > {limit}')
+    return violations
@@ -0,0 +1,63 @@
+import json
+import platform
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from restaurateur.benchmarks import (BUDGETS_PATH, SCALES, check_budgets,
+                                     compare_catalogue_encoders, compare_catalogue_queries,
+                                     isolate_benchmarks, load_budgets, run_benchmarks,
+                                     seed_database)
+
+
+class Command(BaseCommand):
+    help = 'Замеряет число SQL-запросов, время ответа и память API и страниц менеджера на тестовой базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 1000], choices=sorted(SCALES),
+                            help='число заказов в тестовой базе')
+        parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторить каждый запрос')
+        parser.add_argument('--output', help='куда сохранить отчёт в формате JSON')
+        parser.add_argument('--budgets', default=BUDGETS_PATH, help='JSON-файл с допустимыми значениями')
+        parser.add_argument('--no-budgets', action='store_true', help='не сверять результаты с бюджетом')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with isolate_benchmarks():
+                results = self.run_benchmarks(options)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'results': results,
+        }
+        dumped_report = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(dumped_report)
+        self.stdout.write(dumped_report)
+
+        if options['no_budgets']:
+            return
+        violations = check_budgets(results, load_budgets(options['budgets']))
+        if violations:
+            raise CommandError('Превышен бюджет:\n' + '\n'.join(violations))
+
+    def run_benchmarks(self, options):
+        results = {}
+        for size in options['sizes']:
+            call_command('flush', interactive=False, verbosity=0)
+            self.stderr.write(f'Заполняю базу: {size} заказов')
+            seed_database(size)
+            results[str(size)] = run_benchmarks(repeat=options['repeat'])
+            results[str(size)]['catalogue_query'] = compare_catalogue_queries(repeat=options['repeat'])
+            results[str(size)]['catalogue_encoding'] = compare_catalogue_encoders(repeat=options['repeat'])
+        return results
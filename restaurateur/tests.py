@@ -1,3 +1,432 @@
-from django.test import TestCase
+import asyncio
+import datetime as dt
+import json
+import os
+import re
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, connections, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.candidates import refresh_order_candidates
+from foodcartapp.models import (Order, OrderCandidate, OrderItem, Product, ProductCategory,
+                                Restaurant, RestaurantMenuItem)
+from star_burger.db_router import PIN_COOKIE_NAME, ReplicaPinningMiddleware, replica_reads
+from star_burger.instrumentation import InstrumentationMiddleware, get_query_fingerprint
+
+from .benchmarks import (check_budgets, compare_catalogue_encoders, load_budgets, run_benchmarks,
+                         seed_database)
+
+
+def request_over_asgi(client, path):
+    """GET the path through ASGIHandler with the client's cookies.
+
+    Unlike AsyncClient, ASGIHandler reads streamed bodies on its event loop,
+    the way an ASGI server does.
+    """
+    cookies = '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'cookie', cookies.encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    # Like the test client, keep the test transaction's connection open between requests
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        async_to_sync(ASGIHandler())(scope, receive, send)
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+    start, *body_messages = messages
+    headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+    return start['status'], headers, b''.join(message.get('body', b'') for message in body_messages)
+
+
+class ViewOrdersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=category, price=100, image='burger.jpg')
+        cls.fries = Product.objects.create(name='Картофель фри', category=category, price=50, image='fries.jpg')
+        cls.tverskaya = Restaurant.objects.create(name='Тверская', address='Москва, Тверская 1')
+        cls.arbat = Restaurant.objects.create(name='Арбат', address='Москва, Арбат 2')
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=cls.tverskaya, product=cls.burger),
+            RestaurantMenuItem(restaurant=cls.tverskaya, product=cls.fries),
+            RestaurantMenuItem(restaurant=cls.arbat, product=cls.burger),
+            RestaurantMenuItem(restaurant=cls.arbat, product=cls.fries, availability=False),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def create_order(self, products, **fields):
+        now = timezone.now()
+        order = Order.objects.create(address='Москва, Красная площадь', firstname='Иван', lastname='Петров',
+                                     phonenumber='+79001234567', called_at=now, delivered_at=now, **fields)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, price=product.price) for product in products
+        )
+        refresh_order_candidates([order.id])
+        return order
+
+    def get_order_restaurants(self):
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        return {
+            order['id']: {restaurant['name'] for restaurant in order['restaurants']}
+            for order in response.context['orders']
+        }
+
+    def test_only_restaurants_with_every_product_match(self):
+        burger_order = self.create_order([self.burger])
+        full_order = self.create_order([self.burger, self.fries])
+
+        order_restaurants = self.get_order_restaurants()
+
+        self.assertEqual(order_restaurants[burger_order.id], {'Тверская', 'Арбат'})
+        self.assertEqual(order_restaurants[full_order.id], {'Тверская'})
+
+    def test_menu_changes_update_matching(self):
+        order = self.create_order([self.burger, self.fries])
+        self.assertEqual(self.get_order_restaurants()[order.id], {'Тверская'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item = RestaurantMenuItem.objects.get(restaurant=self.arbat, product=self.fries)
+            menu_item.availability = True
+            menu_item.save()
+
+        self.assertEqual(self.get_order_restaurants()[order.id], {'Тверская', 'Арбат'})
+
+    def test_query_count_does_not_depend_on_orders_count(self):
+        self.create_order([self.burger, self.fries])
+        self.client.get(reverse('restaurateur:view_orders'))
+        with CaptureQueriesContext(connection) as one_order_queries:
+            self.client.get(reverse('restaurateur:view_orders'))
+
+        for _ in range(10):
+            self.create_order([self.burger, self.fries])
+        with CaptureQueriesContext(connection) as many_orders_queries:
+            self.client.get(reverse('restaurateur:view_orders'))
+
+        self.assertEqual(len(one_order_queries), len(many_orders_queries))
+
+    def test_unprocessed_orders_are_shown_by_default(self):
+        unprocessed_order = self.create_order([self.burger])
+        processed_order = self.create_order([self.burger], status='processed')
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual([order['id'] for order in response.context['orders']], [unprocessed_order.id])
+
+        response = self.client.get(reverse('restaurateur:view_orders'), {'status': 'all'})
+        self.assertEqual([order['id'] for order in response.context['orders']],
+                         [processed_order.id, unprocessed_order.id])
+
+    def test_anonymous_user_is_redirected_to_login(self):
+        self.client.logout()
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        self.assertRedirects(response, '{}?next={}'.format(reverse('restaurateur:login'),
+                                                           reverse('restaurateur:view_orders')))
+
+    @mock.patch('restaurateur.views.ORDERS_PER_PAGE', 2)
+    def test_keyset_pagination(self):
+        registered_at = timezone.now()
+        orders = [
+            self.create_order([self.burger], registered_at=registered_at - dt.timedelta(minutes=minutes))
+            for minutes in [0, 0, 0, 5, 10]
+        ]
+        expected_ids = [order.id for order in sorted(orders, key=lambda order: (order.registered_at, order.id),
+                                                     reverse=True)]
+
+        shown_ids = []
+        params = {}
+        while True:
+            response = self.client.get(reverse('restaurateur:view_orders'), params)
+            shown_ids += [order['id'] for order in response.context['orders']]
+            if not response.context['next_cursor']:
+                break
+            params = {'after': response.context['next_cursor']}
+
+        self.assertEqual(shown_ids, expected_ids)
+
+
+class ViewProductsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.burger = Product.objects.create(name='Чизбургер', category=category, price=100, image='burger.jpg')
+        cls.fries = Product.objects.create(name='Картофель фри', category=category, price=50, image='fries.jpg')
+        cls.tverskaya = Restaurant.objects.create(name='Тверская <b>PRODUCT_ROWS_PLACEHOLDER</b>')
+        cls.arbat = Restaurant.objects.create(name='Арбат')
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=cls.tverskaya, product=cls.burger),
+            RestaurantMenuItem(restaurant=cls.arbat, product=cls.burger, availability=False),
+            RestaurantMenuItem(restaurant=cls.arbat, product=cls.fries),
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def get_page(self):
+        response = self.client.get(reverse('restaurateur:ProductsView'))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def get_page_over_asgi(self):
+        status_code, _, body = request_over_asgi(self.client, reverse('restaurateur:ProductsView'))
+        self.assertEqual(status_code, 200)
+        return body.decode()
+
+    def get_availability(self, page, product):
+        row = page.split(f'<td>{product.name}</td>', 1)[1].split('</tr>', 1)[0]
+        return re.findall(r'href="#(\w+)"', row)
+
+    def test_restaurant_columns_are_ordered_by_name(self):
+        page = self.get_page()
+
+        self.assertLess(page.index('<th>Арбат</th>'), page.index('<th>Тверская'))
+
+    def test_restaurant_names_are_escaped(self):
+        page = self.get_page()
+
+        self.assertIn('<th>Тверская &lt;b&gt;PRODUCT_ROWS_PLACEHOLDER&lt;/b&gt;</th>', page)
+        self.assertNotIn('<b>PRODUCT_ROWS_PLACEHOLDER</b>', page)
+        self.assertEqual(page.count('</table>'), 1)
+
+    def test_page_is_streamed_over_asgi(self):
+        page = self.get_page_over_asgi()
+
+        self.assertEqual(self.get_availability(page, self.burger), ['unavailable', 'available'])
+        self.assertTrue(page.endswith(self.get_page()))
+
+    def test_availability_cells_follow_restaurant_columns(self):
+        page = self.get_page()
+
+        self.assertEqual(self.get_availability(page, self.burger), ['unavailable', 'available'])
+        self.assertEqual(self.get_availability(page, self.fries), ['available', 'unavailable'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    """The test database stands in for the primary and a separate SQLite file for its replica.
+
+    The replica is added after the test databases are set up, so it is not
+    wrapped in the test transaction and is cleaned up after every test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        replica_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        replica_file.close()
+        cls.replica_path = replica_file.name
+        connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path}
+        with connections['replica'].schema_editor() as schema_editor:
+            for model in [ProductCategory, Product, Restaurant, Order, OrderItem, OrderCandidate]:
+                schema_editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        os.remove(cls.replica_path)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+        cls.product = Product.objects.create(name='Чизбургер', price=100, image='burger.jpg')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def tearDown(self):
+        Order.objects.using('replica').all().delete()
+
+    def create_order(self, database, firstname):
+        return Order.objects.using(database).create(address='Москва, Красная площадь', firstname=firstname,
+                                                    lastname='Петров', phonenumber='+79001234567')
+
+    def get_order_names(self):
+        response = self.client.get(reverse('restaurateur:view_orders'), {'status': 'all'})
+        return [order['firstname'] for order in response.context['orders']]
+
+    def test_manager_pages_read_from_replica(self):
+        self.create_order('default', 'Основная')
+        self.create_order('replica', 'Реплика')
+
+        self.assertEqual(self.get_order_names(), ['Реплика'])
+
+    def test_write_pins_request_to_primary(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Order), 'replica')
+            Restaurant.objects.create(name='Тверская')
+            self.assertEqual(router.db_for_read(Order), 'default')
+
+    def test_pinning_works_in_async_middleware_chain(self):
+        async def get_response(request):
+            await sync_to_async(Restaurant.objects.create)(name='Тверская')
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_client_stays_on_primary_after_write(self):
+        self.create_order('replica', 'Реплика')
+
+        response = self.client.post('/api/order/', {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Красная площадь',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.get_order_names(), ['Иван'])
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SLOW_REQUEST_MS=60_000,
+                   INSTRUMENTATION_SAMPLE_RATE=1.0)
+class InstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+        Product.objects.create(name='Чизбургер', price=100, image='burger.jpg')
+        Restaurant.objects.create(name='Тверская')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def get(self, path):
+        with mock.patch('star_burger.instrumentation.logger') as logger:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        return response, len(queries), logger
+
+    @staticmethod
+    def get_header_queries(response):
+        return int(re.search(r'desc="(\d+) queries"', response['Server-Timing'])[1])
+
+    def test_server_timing_header(self):
+        response, queries_count, _ = self.get('/api/products/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", cache;desc="\d+ hits, '
+                                                    r'\d+ misses", geocoder;desc="0 calls", total;dur=[\d.]+$')
+        self.assertEqual(self.get_header_queries(response), queries_count)
+
+    def test_streamed_queries_are_logged(self):
+        def stream_restaurant_names(request):
+            return StreamingHttpResponse(Restaurant.objects.values_list('name', flat=True).iterator())
+
+        middleware = InstrumentationMiddleware(stream_restaurant_names)
+        with mock.patch('star_burger.instrumentation.logger') as logger:
+            response = middleware(RequestFactory().get('/'))
+            self.assertEqual(self.get_header_queries(response), 0)
+            self.assertEqual(b''.join(response), 'Тверская'.encode())
+            logger.info.assert_not_called()
+            response.close()
+
+        record = json.loads(logger.info.call_args.args[0])
+        self.assertEqual(record['queries'], 1)
+
+    def test_async_requests_are_measured_without_leaving_the_event_loop(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = InstrumentationMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        with mock.patch('star_burger.instrumentation.logger'):
+            status_code, headers, _ = request_over_asgi(self.client, '/api/products/')
+
+        self.assertEqual(status_code, 200)
+        self.assertGreater(self.get_header_queries({'Server-Timing': headers['server-timing']}), 0)
+
+    @override_settings(INSTRUMENTATION_SLOW_REQUEST_MS=0)
+    def test_slow_requests_log_query_fingerprints(self):
+        _, queries_count, logger = self.get(reverse('restaurateur:view_orders'))
+
+        logger.info.assert_not_called()
+        record = json.loads(logger.warning.call_args.args[0])
+        self.assertTrue(record['slow'])
+        self.assertEqual(sum(query['count'] for query in record['top_queries']), queries_count)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_fast_requests_are_sampled(self):
+        response, _, logger = self.get('/api/products/')
+
+        self.assertIn('Server-Timing', response)
+        logger.info.assert_not_called()
+        logger.warning.assert_not_called()
+
+    def test_query_fingerprint(self):
+        sql = "SELECT \"name\" FROM \"product\"\n WHERE \"id\" IN (1, 2, 3) AND \"name\" = 'it''s' LIMIT 21"
+
+        self.assertEqual(get_query_fingerprint(sql),
+                         'SELECT "name" FROM "product" WHERE "id" IN (...) AND "name" = ? LIMIT ?')
+
+
+class BenchmarkBudgetTest(TestCase):
+    def test_query_budgets(self):
+        seed_database(10)
+
+        report = {'10': run_benchmarks(repeat=1)}
+
+        budgets = load_budgets()
+        query_budgets = {
+            size: {endpoint: {'queries': budget['queries']} for endpoint, budget in endpoints.items()}
+            for size, endpoints in budgets.items()
+        }
+        self.assertEqual(check_budgets(report, query_budgets), [])
+
+    def test_compact_encoding_is_smaller(self):
+        seed_database(10)
+
+        comparison = compare_catalogue_encoders(repeat=1)
+
+        self.assertLess(comparison['stdlib_compact']['size_kb'], comparison['stdlib_indented']['size_kb'])
+
+    def test_benchmarks_do_not_touch_configured_cache(self):
+        seed_database(10)
+        cache.set('catalogue', 'real catalogue')
+
+        run_benchmarks(repeat=1)
+
+        self.assertEqual(cache.get('catalogue'), 'real catalogue')
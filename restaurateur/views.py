@@ -1,19 +1,29 @@
+import datetime as dt
+import functools
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
-from django.core.cache import cache
-from django.db.models import DecimalField, F, Sum
-from django.shortcuts import redirect, render
+from django.contrib.auth.views import redirect_to_login
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render, resolve_url
+from django.template.loader import get_template, render_to_string
 from django.urls import reverse_lazy
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.safestring import mark_safe
 from django.views import View
-from geopy import distance
-from requests.exceptions import HTTPError
 
-from foodcartapp.models import Order, Product, Restaurant
-from star_burger.settings import YANDEX_GEOCODER_API_KEY
+from foodcartapp.models import Order, OrderCandidate, Product, Restaurant, RestaurantMenuItem
+from star_burger.db_router import read_from_replica
+
+ORDERS_PER_PAGE = 50
+PRODUCTS_CHUNK_SIZE = 200
 
-from .utils import fetch_coordinates
+ProductRow = namedtuple('ProductRow', ['id', 'name', 'category', 'price', 'image_url'])
 
 
 class Login(forms.Form):
@@ -68,28 +78,68 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
+def async_manager_required(view):
+    """user_passes_test(is_manager) for async views, the user is loaded in a worker thread."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if await sync_to_async(is_manager)(request.user):
+            return await view(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path(), resolve_url('restaurateur:login'))
+    return wrapper
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_from_replica
 def view_products(request):
     restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
-
-    default_availability = {restaurant.id: False for restaurant in restaurants}
-    products_with_restaurants = []
-    for product in products:
-        availability = {
-            **default_availability,
-            **{item.restaurant_id: item.availability for item in product.menu_items.all()},
-        }
-        orderer_availability = [availability[restaurant.id] for restaurant in restaurants]
-
-        products_with_restaurants.append(
-            (product, orderer_availability)
-        )
-
-    return render(request, template_name="products_list.html", context={
-        'products_with_restaurants': products_with_restaurants,
-        'restaurants': restaurants,
-    })
+    availability = RestaurantMenuItem.objects.get_availability_bitsets(
+        [restaurant.id for restaurant in restaurants]
+    )
+    # Under ASGI the body is sent from the event loop, where the ORM is not allowed, so rows are read now
+    products = list(Product.objects
+                    .order_by('id')
+                    .values_list('id', 'name', 'category__name', 'price', 'image'))
+
+    context = {'restaurants': restaurants}
+    page_head = render_to_string('products_list_head.html', context, request)
+    page_tail = render_to_string('products_list_tail.html', context, request)
+
+    return StreamingHttpResponse(
+        _stream_products(request, page_head, page_tail, products, availability, len(restaurants))
+    )
+
+
+def _stream_products(request, page_head, page_tail, products, availability, restaurants_count):
+    """Render product rows chunk by chunk, so the rendered page is never held in memory whole."""
+    yield page_head
+
+    # Every table cell is one of two snippets, rendering them once is much faster than per cell
+    cell_template = get_template('products_list_cell.html')
+    cells = [cell_template.render({'available': available}) for available in (False, True)]
+
+    image_storage = Product._meta.get_field('image').storage
+    rows_template = get_template('products_list_rows.html')
+    for products_chunk in _get_chunks(products, PRODUCTS_CHUNK_SIZE):
+        products_with_restaurants = []
+        for product_id, name, category, price, image in products_chunk:
+            product = ProductRow(product_id, name, category, price, image_storage.url(image))
+            bitset = availability.get(product_id, 0)
+            availability_cells = ''.join(cells[bitset >> bit & 1] for bit in range(restaurants_count))
+            products_with_restaurants.append((product, mark_safe(availability_cells)))
+        yield rows_template.render({'products_with_restaurants': products_with_restaurants}, request)
+
+    yield page_tail
+
+
+def _get_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
@@ -99,8 +149,37 @@ def view_restaurants(request):
     })
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
+@async_manager_required
+@read_from_replica
+async def view_orders(request):
+    # There is no async ORM in Django 3.2, so queries and rendering run in a worker thread
+    context = await sync_to_async(_get_orders_context)(request)
+    return await sync_to_async(render)(request, template_name='order_items.html', context=context)
+
+
+def _get_orders_context(request):
+    statuses = dict(Order.STATUS_CHOICES)
+    status = request.GET.get('status', 'unprocessed')
+    if status not in statuses:
+        status = 'all'
+
+    orders = Order.objects.order_by('-registered_at', '-id')
+    if status != 'all':
+        orders = orders.filter(status=status)
+
+    cursor = _decode_cursor(request.GET.get('after', ''))
+    if cursor:
+        orders = orders.registered_before(*cursor)
+
+    candidates = (OrderCandidate.objects
+                  .select_related('restaurant')
+                  .order_by(F('distance_km').asc(nulls_last=True), 'restaurant_id'))
+    orders = list(orders.prefetch_related(Prefetch('candidates', queryset=candidates))[:ORDERS_PER_PAGE + 1])
+    next_cursor = None
+    if len(orders) > ORDERS_PER_PAGE:
+        orders = orders[:ORDERS_PER_PAGE]
+        next_cursor = _encode_cursor(orders[-1])
+
     orders = [
         {'id': order.id,
          'status': order.get_status_display(),
@@ -110,62 +189,32 @@ def view_orders(request):
          'address': order.address,
          'comment': order.comment,
          'payment_method': order.get_payment_method_display(),
-         'restaurants': sorted(_get_order_restaurants_with_coords(order),
-                               key=lambda restaurant: restaurant['distance']
-                               ),
+         'restaurants': [{'name': candidate.restaurant.name, 'distance': candidate.distance_km}
+                         for candidate in order.candidates.all()],
          'total_amount': order.total_amount,
 
          }
 
-        for order in (Order.objects
-                      .prefetch_related('items__product__menu_items')
-                      .order_by('-registered_at')
-                      .get_total_amount()
-                      )
-
+        for order in orders
     ]
 
-    return render(request, template_name='order_items.html', context={
+    return {
         'orders': orders,
-    })
-
-
-def _get_order_restaurants(order) -> set:
-    restaurants = set()
-
-    for item in order.items.all():
-        for menu_item in item.product.menu_items.filter(availability=True):
-            restaurants.add(menu_item.restaurant)
-
-    return restaurants
-
-
-def _get_order_restaurants_with_coords(order) -> list:
-    restaurants = []
-
-    for restaurant in _get_order_restaurants(order):
-        try:
-            distance_ = _get_distance(order.address, restaurant.address)
-        except (IndexError, HTTPError):
-            continue
-        restaurants.append({'name': restaurant.name,
-                            'distance': distance_})
-
-    return restaurants
-
-
-def _get_distance(place, restaurant):
-    place_coords, restaurant_coords = map(_get_coordinates, [place, restaurant])
-    distance_ = distance.distance(place_coords, restaurant_coords)
+        'status': status,
+        'statuses': statuses,
+        'next_cursor': next_cursor,
+    }
 
-    return distance_.km
 
+def _encode_cursor(order):
+    cursor = '{}|{}'.format(order.registered_at.isoformat(), order.id)
+    return urlsafe_base64_encode(cursor.encode())
 
-def _get_coordinates(place):
-    coords = cache.get(place)
 
-    if coords is None:
-        coords = fetch_coordinates(YANDEX_GEOCODER_API_KEY, place)
-        cache.set(place, coords, 60 * 30)
+def _decode_cursor(cursor):
+    try:
+        registered_at, order_id = urlsafe_base64_decode(cursor).decode().split('|')
+        return dt.datetime.fromisoformat(registered_at), int(order_id)
+    except ValueError:
+        return None
 
-    return coords
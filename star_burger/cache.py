@@ -0,0 +1,257 @@
+"""Two-tier cache: a small in-process LRU in front of a shared cache backend.
+
+The shared tier is any Django cache, usually file-based or Redis, configured
+through the `SHARED` option. Reads hit process memory first, so hot keys such
+as catalogue snapshots cost no round-trip. Local entries live for
+`LOCAL_TIMEOUT` seconds at most, which bounds how long a process may serve a
+value already changed by another process.
+
+A missing value is computed by one process at a time. The lock is an
+atomic add() of a lock key on Redis or memcached. The file-based backend
+has no atomic add(), so there the lock is a file created with O_EXCL next
+to the cache files.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.module_loading import import_string
+
+from . import instrumentation
+
+_local_caches = {}
+_local_caches_lock = threading.Lock()
+
+
+class LocalLRUCache:
+    """Process-wide LRU storage shared by the per-thread TwoTierCache instances."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.stats = Counter()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if timeout <= 0:
+            self.delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, pickled)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def release_key_lock(self, key):
+        with self.lock:
+            self.key_locks.pop(key, None)
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), max_entries=self.max_entries)
+        requests_count = stats.get('local_hits', 0) + stats.get('shared_hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = (requests_count - stats.get('misses', 0)) / requests_count if requests_count else None
+        return stats
+
+
+def get_cache_stats():
+    """Hit/miss counters of every two-tier cache in this process, keyed by cache name."""
+    with _local_caches_lock:
+        local_caches = dict(_local_caches)
+    return {name: local_cache.get_stats() for name, local_cache in local_caches.items()}
+
+
+def create_lock_file(path):
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        shared_params = dict(options['SHARED'])
+        shared_backend = import_string(shared_params.pop('BACKEND'))
+        self.shared = shared_backend(shared_params.pop('LOCATION', ''), shared_params)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+
+        with _local_caches_lock:
+            self.local = _local_caches.setdefault(location or 'default', LocalLRUCache(
+                max_entries=options.get('LOCAL_MAX_ENTRIES', 1000),
+                timeout=options.get('LOCAL_TIMEOUT', 5),
+            ))
+
+    def get_local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return timeout
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version=version)
+        value = self.local.get(local_key)
+        if value is not None:
+            self.local.count('local_hits')
+            instrumentation.count('cache_hits')
+            return value
+
+        value = self.shared.get(key, version=version)
+        if value is None:
+            self.local.count('misses')
+            instrumentation.count('cache_misses')
+            return default
+        self.local.count('shared_hits')
+        instrumentation.count('cache_hits')
+        self.local.set(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self.local.set(self.make_key(key, version=version), value, self.get_local_timeout(timeout))
+        self.local.count('sets')
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added:
+            self.local.set(self.make_key(key, version=version), value, self.get_local_timeout(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if self.local.get(self.make_key(key, version=version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(self.make_key(key, version=version))
+        return self.shared.incr(key, delta=delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """Compute a missing value once per key, even under concurrent misses.
+
+        Threads of this process wait on a per-key lock. Other processes see a
+        lock key in the shared tier and wait for the value to appear there,
+        recomputing it themselves only if the holder takes too long.
+        """
+        value = self.get(key, version=version)
+        if value is not None:
+            return value
+        if not callable(default):
+            return super().get_or_set(key, default, timeout=timeout, version=version)
+
+        local_key = self.make_key(key, version=version)
+        try:
+            with self.local.get_key_lock(local_key):
+                return self.compute_once(key, default, timeout, version)
+        finally:
+            self.local.release_key_lock(local_key)
+
+    def compute_once(self, key, default, timeout, version):
+        value = self.get(key, version=version)
+        if value is not None:
+            return value
+
+        lock_key = '{}:lock'.format(key)
+        if not self.acquire_lock(lock_key, version):
+            self.local.count('lock_waits')
+            value = self.wait_for_value(key, version)
+            if value is not None:
+                return value
+        try:
+            value = default()
+            if value is not None:
+                self.set(key, value, timeout=timeout, version=version)
+        finally:
+            self.release_lock(lock_key, version)
+        return value
+
+    def get_lock_path(self, lock_key, version):
+        return os.path.splitext(self.shared._key_to_file(lock_key, version))[0] + '.lock'
+
+    def acquire_lock(self, lock_key, version):
+        """Take the shared lock of a key, False if another process holds it."""
+        if not isinstance(self.shared, FileBasedCache):
+            return self.shared.add(lock_key, 1, timeout=self.lock_timeout, version=version)
+
+        lock_path = self.get_lock_path(lock_key, version)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        if create_lock_file(lock_path):
+            return True
+        # A lock file left by a crashed process expires like a lock key would
+        try:
+            if time.time() - os.path.getmtime(lock_path) < self.lock_timeout:
+                return False
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        return create_lock_file(lock_path)
+
+    def release_lock(self, lock_key, version):
+        if not isinstance(self.shared, FileBasedCache):
+            self.shared.delete(lock_key, version=version)
+            return
+        try:
+            os.remove(self.get_lock_path(lock_key, version))
+        except FileNotFoundError:
+            pass
+
+    def wait_for_value(self, key, version):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.shared.get(key, version=version)
+            if value is not None:
+                self.local.set(self.make_key(key, version=version), value)
+                return value
+        return None
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
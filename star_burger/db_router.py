@@ -0,0 +1,137 @@
+"""Read replicas for the manager pages.
+
+Replica aliases are listed in settings.DATABASE_REPLICAS. Reads go to a
+random replica only inside views decorated with `read_from_replica`, and
+only until the request writes anything: from then on the request reads
+from the primary and sees its own changes. ReplicaPinningMiddleware also
+keeps the client on the primary for REPLICA_PIN_SECONDS after a write, so
+that the next page does not show data the replica has not received yet.
+"""
+import asyncio
+import contextvars
+import functools
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE_NAME = 'pin_primary_db'
+
+_current_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+class ReplicaRouting:
+    """Routing state of one request, shared by every thread serving it."""
+
+    def __init__(self, pinned=False):
+        self.use_replicas = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def replica_reads():
+    routing = _current_routing.get()
+    token = None
+    if routing is None:
+        routing = ReplicaRouting()
+        token = _current_routing.set(routing)
+    use_replicas = routing.use_replicas
+    routing.use_replicas = True
+    try:
+        yield routing
+    finally:
+        routing.use_replicas = use_replicas
+        if token is not None:
+            _current_routing.reset(token)
+
+
+def read_from_replica(view):
+    """Let the view read from a replica until it writes. Works for sync and async views."""
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with replica_reads():
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _current_routing.get()
+        if routing is None or not routing.use_replicas or routing.pinned or not settings.DATABASE_REPLICAS:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        routing = _current_routing.get()
+        if routing is not None:
+            routing.pinned = routing.wrote = True
+        # Instances read from a replica are saved to the primary as well
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Read from the primary for a while after a client writes.
+
+    Disabled unless replicas are configured. Works in both sync and async
+    middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = settings.REPLICA_PIN_SECONDS
+
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Makes Django treat the instance as a coroutine function, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing = ReplicaRouting(pinned=PIN_COOKIE_NAME in request.COOKIES)
+        token = _current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+        return self.pin_client(routing, response)
+
+    async def __acall__(self, request):
+        routing = ReplicaRouting(pinned=PIN_COOKIE_NAME in request.COOKIES)
+        token = _current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+        return self.pin_client(routing, response)
+
+    def pin_client(self, routing, response):
+        if routing.wrote and self.pin_seconds:
+            response.set_cookie(PIN_COOKIE_NAME, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
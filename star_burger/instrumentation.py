@@ -0,0 +1,202 @@
+"""Per-request counters of SQL queries, cache lookups and geocoder calls.
+
+Code anywhere in the project reports events with `count()`. The counters
+only exist while InstrumentationMiddleware is handling a request, otherwise
+`count()` is a single context variable lookup.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('star_burger.requests')
+
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.counters = Counter()
+        self.sql_time = 0
+        self.statements = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def record_query(self, sql, duration):
+        with self.lock:
+            self.counters['queries'] += 1
+            self.sql_time += duration
+            self.statements[sql] += 1
+
+
+def count(name, value=1):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.count(name, value)
+
+
+def get_query_fingerprint(sql):
+    """Reduce SQL to its shape, so that queries differing only in parameters group together."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    sql = re.sub(r'\((?:\s*(?:%s|\?)\s*,?)+\)', '(...)', sql)
+    return ' '.join(sql.split())
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper that reports the query to the metrics of the current request."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started_at)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware:
+    """Measure every request and report it in Server-Timing headers and log lines.
+
+    Disabled unless settings.INSTRUMENTATION_ENABLED is set, in which case
+    Django drops the middleware at startup and requests pay nothing.
+
+    Works in both sync and async middleware chains. Queries are recorded by
+    a wrapper installed on every database connection, and reported to the
+    request whose metrics are in the context, which sync_to_async passes on
+    to the threads running the ORM.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request_ms = settings.INSTRUMENTATION_SLOW_REQUEST_MS
+        self.sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+
+        connection_created.connect(install_query_recorder)
+        for connection in connections.all():
+            install_query_recorder(connection)
+
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Makes Django treat the instance as a coroutine function, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        started_at = time.perf_counter()
+        with self.measure(metrics):
+            response = self.get_response(request)
+        return self.report(request, response, metrics, started_at)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        started_at = time.perf_counter()
+        with self.measure(metrics):
+            response = await self.get_response(request)
+        return self.report(request, response, metrics, started_at)
+
+    def report(self, request, response, metrics, started_at):
+        response['Server-Timing'] = self.get_server_timing(metrics, self.get_elapsed_ms(started_at))
+        if not response.streaming:
+            self.log_request(request, response, metrics, self.get_elapsed_ms(started_at))
+            return response
+
+        # Headers leave before the body, so Server-Timing only covers the view.
+        # Queries run while the content is sent are added to the log line,
+        # which is written when the server closes the response.
+        response.streaming_content = self.measure_content(response.streaming_content, metrics)
+        close_response = response.close
+
+        def close():
+            close_response()
+            self.log_request(request, response, metrics, self.get_elapsed_ms(started_at))
+
+        response.close = close
+        return response
+
+    @staticmethod
+    @contextmanager
+    def measure(metrics):
+        token = _current_metrics.set(metrics)
+        try:
+            yield
+        finally:
+            _current_metrics.reset(token)
+
+    def measure_content(self, content, metrics):
+        content = iter(content)
+        while True:
+            with self.measure(metrics):
+                chunk = next(content, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    @staticmethod
+    def get_elapsed_ms(started_at):
+        return (time.perf_counter() - started_at) * 1000
+
+    @staticmethod
+    def get_server_timing(metrics, total_ms):
+        counters = metrics.counters
+        return ', '.join([
+            'db;dur={:.1f};desc="{} queries"'.format(metrics.sql_time * 1000, counters['queries']),
+            'cache;desc="{} hits, {} misses"'.format(counters['cache_hits'], counters['cache_misses']),
+            'geocoder;desc="{} calls"'.format(counters['geocoder_calls']),
+            'total;dur={:.1f}'.format(total_ms),
+        ])
+
+    def log_request(self, request, response, metrics, total_ms):
+        is_slow = total_ms >= self.slow_request_ms
+        if not is_slow and random.random() >= self.sample_rate:
+            return
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'sql_ms': round(metrics.sql_time * 1000, 1),
+            'queries': metrics.counters['queries'],
+            'cache_hits': metrics.counters['cache_hits'],
+            'cache_misses': metrics.counters['cache_misses'],
+            'geocoder_calls': metrics.counters['geocoder_calls'],
+        }
+        if not is_slow:
+            logger.info(json.dumps(record, ensure_ascii=False))
+            return
+
+        fingerprints = Counter()
+        for sql, executions_count in metrics.statements.items():
+            fingerprints[get_query_fingerprint(sql)] += executions_count
+        record['slow'] = True
+        record['top_queries'] = [
+            {'count': executions_count, 'sql': fingerprint}
+            for fingerprint, executions_count in fingerprints.most_common(10)
+        ]
+        logger.warning(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,44 @@
+"""Compact JSON encoding shared by the plain Django views and DRF.
+
+orjson is an optional dependency. When it is installed, it encodes
+dicts, lists, strings and numbers natively and only falls back to Python
+for the remaining types. Everything else is encoded the way
+DjangoJSONEncoder does it, so the output is the same with or without
+orjson: Decimal prices stay strings and datetimes keep Django's format.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_django_encoder = DjangoJSONEncoder()
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def encode_default(value):
+    return _django_encoder.default(value)
+
+
+def dumps(data):
+    """Encode data as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, default=encode_default, option=ORJSON_OPTIONS)
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class CompactJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
@@ -19,18 +19,20 @@ ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
     'restaurateur.apps.RestaurateurConfig',
+    'places.apps.PlacesConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'rest_framework',
     'phonenumber_field',
 ]
 
 MIDDLEWARE = [
+    'star_burger.instrumentation.InstrumentationMiddleware',
+    'star_burger.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,9 +40,21 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+STATIC_FILES_COMPRESSED = env.bool('STATIC_FILES_COMPRESSED', False)
+if STATIC_FILES_COMPRESSED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'whitenoise.middleware.WhiteNoiseMiddleware')
+
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+INSTRUMENTATION_ENABLED = env.bool('INSTRUMENTATION_ENABLED', False)
+INSTRUMENTATION_SLOW_REQUEST_MS = env.int('INSTRUMENTATION_SLOW_REQUEST_MS', 500)
+INSTRUMENTATION_SAMPLE_RATE = env.float('INSTRUMENTATION_SAMPLE_RATE', 1.0)
+
 ROOT_URLCONF = 'star_burger.urls'
 
 DEBUG_TOOLBAR_PANELS = [
@@ -77,9 +91,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'star_burger.wsgi.application'
+ASGI_APPLICATION = 'star_burger.asgi.application'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+IMAGE_VARIANTS_WORKERS = env.int('IMAGE_VARIANTS_WORKERS', None)
 
 DATABASES = {
     'default': dj_database_url.config(
@@ -87,6 +103,16 @@ DATABASES = {
     )
 }
 
+REPLICA_DATABASE_URLS = env.list('REPLICA_DATABASE_URLS', [])
+DATABASE_REPLICAS = []
+for number, replica_url in enumerate(REPLICA_DATABASE_URLS):
+    alias = 'replica_{}'.format(number)
+    # Tests read replicas' data from the test copy of the primary
+    DATABASES[alias] = dict(dj_database_url.parse(replica_url), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['star_burger.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', 5)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -114,6 +140,13 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'star_burger.renderers.CompactJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 INTERNAL_IPS = [
     '127.0.0.1'
 ]
@@ -123,11 +156,58 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "bundles"),
 ]
 
+if STATIC_FILES_COMPRESSED:
+    # collectstatic writes hashed copies of files with .gz and .br next to them,
+    # WhiteNoise serves the hashed ones with an immutable Cache-Control
+    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
 YANDEX_GEOCODER_API_KEY = env('YANDEX_GEOCODER_API_KEY', 'REPLACE_ME')
+YANDEX_GEOCODER_URL = env('YANDEX_GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+YANDEX_GEOCODER_WORKERS = env.int('YANDEX_GEOCODER_WORKERS', 8)
+YANDEX_GEOCODER_RATE_LIMIT = env.float('YANDEX_GEOCODER_RATE_LIMIT', 10)
+YANDEX_GEOCODER_RETRIES = env.int('YANDEX_GEOCODER_RETRIES', 3)
+GEOCODER_BACKGROUND = env.bool('GEOCODER_BACKGROUND', False)
+GEOCODER_FAILED_RETRY_MINUTES = env.int('GEOCODER_FAILED_RETRY_MINUTES', 60)
+
+GEODESIC_DISTANCES = env.bool('GEODESIC_DISTANCES', False)
+ORDER_CANDIDATES_RADIUS_KM = env.float('ORDER_CANDIDATES_RADIUS_KM', None)
+
+ORDER_INTAKE_ASYNC = env.bool('ORDER_INTAKE_ASYNC', False)
+ORDER_QUEUE_PATH = env('ORDER_QUEUE_PATH', os.path.join(BASE_DIR, 'order_queue.sqlite3'))
+ORDER_QUEUE_LEASE_SECONDS = env.int('ORDER_QUEUE_LEASE_SECONDS', 60)
+ORDER_QUEUE_MAX_ATTEMPTS = env.int('ORDER_QUEUE_MAX_ATTEMPTS', 5)
+IDEMPOTENCY_KEY_TTL_HOURS = env.int('IDEMPOTENCY_KEY_TTL_HOURS', 24)
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'my_cache_table',
+        'BACKEND': 'star_burger.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': env.dj_cache_url(
+                'CACHE_URL',
+                'file://{0}'.format(os.path.join(BASE_DIR, 'django_cache'))
+            ),
+            'LOCAL_MAX_ENTRIES': env.int('CACHE_LOCAL_MAX_ENTRIES', 1000),
+            'LOCAL_TIMEOUT': env.int('CACHE_LOCAL_TIMEOUT', 5),
+        },
     }
 }
+SNAPSHOT_TIMEOUT = env.int('SNAPSHOT_TIMEOUT', 24 * 60 * 60)
+
+TEST_RUNNER = 'star_burger.test_runner.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'star_burger': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,33 @@
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Tests clear the cache, so they get a private in-memory one instead of CACHE_URL
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'star_burger.cache.TwoTierCache',
+        'LOCATION': 'tests',
+        'OPTIONS': {
+            'SHARED': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'tests',
+            },
+        },
+    },
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Runs tests with a private cache and a temporary MEDIA_ROOT."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(CACHES=TEST_CACHES, MEDIA_ROOT=self.media_root.name)
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+        super().teardown_test_environment(**kwargs)
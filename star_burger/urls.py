@@ -20,8 +20,10 @@ from django.shortcuts import render
 from django.urls import include, path
 
 from . import settings
+from .views import view_cache_stats
 
 urlpatterns = [
+    path('admin/cache-stats/', admin.site.admin_view(view_cache_stats), name='cache_stats'),
     path('admin/', admin.site.urls),
     path('', render, kwargs={'template_name': 'index.html'}, name='start_page'),
     path('api/', include('foodcartapp.urls')),
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from django.shortcuts import render
+
+from .cache import get_cache_stats
+
+
+def view_cache_stats(request):
+    return render(request, 'admin/cache_stats.html', context={
+        **admin.site.each_context(request),
+        'title': 'Статистика кэша',
+        'cache_stats': get_cache_stats(),
+    })